@@ -1,7 +1,15 @@
+import datetime
+import functools
+import os
 import sys
+import time
 
+import numpy as np
+
+from rower_monitor import acquisition_process as ap
 from rower_monitor import config_loader as cf
 from rower_monitor import data_sources as ds
+from rower_monitor import pulse_latency
 from rower_monitor import workout as wo
 
 from PyQt5 import QtCore, QtWidgets, QtGui
@@ -20,14 +28,6 @@ from PyQt5.QtChart import (
 DEV_MODE = False
 
 
-# Idea taken from: https://medium.com/@armin.samii/avoiding-random-crashes-when-multithreading-qt-f740dc16059
-class SignalEmitter(QtCore.QObject):
-    updated = QtCore.pyqtSignal()
-
-    def __init__(self):
-        super(SignalEmitter, self).__init__()
-
-
 class RowingMonitorMainWindow(QtWidgets.QMainWindow):
     COLOR_RED = QColor('#E03A3E')
     COLOR_BLUE = QColor('#009DDC')
@@ -55,21 +55,35 @@ class RowingMonitorMainWindow(QtWidgets.QMainWindow):
     GUI_FONT_LARGE = QtGui.QFont('Nunito', 24)
     GUI_FONT_MEDIUM = QtGui.QFont('Nunito', 16)
 
-    def __init__(self, config, data_source, *args, **kwargs):
+    def __init__(self, config, data_source_factory, *args, **kwargs):
         super(RowingMonitorMainWindow, self).__init__(*args, **kwargs)
 
         self.setWindowTitle('Rowing Monitor')
 
         self.config = config
         self.log_folder_path = config.log_folder_path
-        self.workout = wo.WorkoutMetricsTracker(
-            config=config,
-            data_source=data_source
-        )
+        self.acquisition_process = None
+        if config.run_acquisition_in_separate_process:
+            # The workout runs in its own process, and self.workout is a read-only view of its results.
+            self.acquisition_process = ap.AcquisitionProcess(
+                config=config,
+                data_source_factory=data_source_factory,
+                log_folder_path=None if self.DISABLE_LOGGING or DEV_MODE else self.log_folder_path
+            )
+            self.workout = self.acquisition_process.workout_view
+        else:
+            self.workout = wo.WorkoutMetricsTracker(
+                config=config,
+                data_source=data_source_factory()
+            )
 
-        # Connect workut emitter to UI update
-        self.workout_qt_emitter = SignalEmitter()
-        self.workout_qt_emitter.updated.connect(self.ui_callback)
+        # Refresh the UI at a fixed frame rate, with all the data that arrived since the previous frame, instead of
+        # on every encoder pulse. The workout runs on another thread (or process) and never calls into the GUI.
+        self.frame_timer = QtCore.QTimer()
+        self.frame_timer.setInterval(round(1000 / config.ui_refresh_rate_hz))
+        self.frame_timer.timeout.connect(self.ui_callback)
+        self.num_pulses_seen = 0
+        self.last_plotted_torque_timestamp = float('-inf')
 
         # Setup main window layout
         self.main_widget = QtWidgets.QWidget()
@@ -97,8 +111,13 @@ class RowingMonitorMainWindow(QtWidgets.QMainWindow):
         self.start_button.setMinimumSize(97, 60)
         self.start_button.setMaximumSize(97, 60)
 
+        # Pulse-to-pixel latency debug overlay
+        self.latency_label = QtWidgets.QLabel('')
+        self.latency_label.setVisible(config.measure_pulse_latency)
+
         # Add to main window
         self.button_bar_layout.addWidget(self.start_button)
+        self.button_bar_layout.addWidget(self.latency_label)
         #self.button_bar_layout.addWidget(self.button_bar_background_widget)
         self.button_bar_layout.setAlignment(QtCore.Qt.AlignLeft)
         self.button_bar_layout.setContentsMargins(0, 0, 0, 0) #(left, top, right, bottom)
@@ -169,12 +188,18 @@ class RowingMonitorMainWindow(QtWidgets.QMainWindow):
         self.stats_layout.addLayout(self.metrics_panel_layout)
         self.stats_layout.addLayout(self.charts_panel_layout)
 
-        self.xdata = [0.0 for i in range(self.PLOT_VISIBLE_SAMPLES)]
-        self.ydata = [0.0 for i in range(self.PLOT_VISIBLE_SAMPLES)]
+        # Ring buffer of (timestamp, torque) points for the force plot. Like SharedMemoryRing, every point is stored
+        # twice, at slots i and i + PLOT_VISIBLE_SAMPLES, so the visible points are always one contiguous slice.
+        self.torque_plot_data = np.zeros((2 * self.PLOT_VISIBLE_SAMPLES, 2))
+        self.torque_plot_next_slot = 0
 
-        self.work_per_stroke_data = [0.0 for i in range(self.WORK_PLOT_VISIBLE_STROKES)]
-        self.boat_speed_data = [0.0 for i in range(self.WORK_PLOT_VISIBLE_STROKES)]
+        # The bar charts reuse a fixed pool of bars. Each new stroke overwrites the oldest bar, at the slot after the
+        # latest one, so the charts sweep from left to right and wrap around, like a heart rate monitor. They no longer
+        # scroll: that would mean updating every visible bar on every stroke.
+        self.work_plot_latest_slot = self.WORK_PLOT_VISIBLE_STROKES - 1
+        self.boat_speed_plot_latest_slot = self.BOAT_SPEED_PLOT_VISIBLE_STROKES - 1
         self.seen_strokes = 0
+        self.seen_drives = 0
 
         ############################################
         # Add torque chart
@@ -191,6 +216,7 @@ class RowingMonitorMainWindow(QtWidgets.QMainWindow):
         self.torque_plot_series = QLineSeries(self)
         for i in range(self.PLOT_VISIBLE_SAMPLES):
             self.torque_plot_series.append(0, 0)
+        self.torque_plot_series.setUseOpenGL(config.use_opengl_charts)
         #self.torque_plot_series.setColor(QColor('#009DDC'))
         pen = self.torque_plot_series.pen()
         pen.setWidth(3)
@@ -254,6 +280,7 @@ class RowingMonitorMainWindow(QtWidgets.QMainWindow):
         self.work_plot_series.append(self.work_plot_bar_set_list)
         for bar_set in self.work_plot_bar_set_list:
             bar_set.append(0)
+            bar_set.setColor(self.COLOR_BLUE)
         self.work_plot_series.setBarWidth(1.0)
 
         # Compose plot
@@ -302,6 +329,7 @@ class RowingMonitorMainWindow(QtWidgets.QMainWindow):
         self.boat_speed_plot_series.append(self.boat_speed_plot_bar_set_list)
         for bar_set in self.boat_speed_plot_bar_set_list:
             bar_set.append(0)
+            bar_set.setColor(self.COLOR_BLUE)
         self.boat_speed_plot_series.setBarWidth(1.0)
 
         # Compose plot
@@ -349,36 +377,46 @@ class RowingMonitorMainWindow(QtWidgets.QMainWindow):
         self.start_timestamp = None
         self.started = False
 
+        # Pulse-to-pixel latency. Frames are timed once the distance label, which changes on every frame, has been
+        # painted.
+        self.latency_window = None
+        self.last_timed_pulse_timestamp = float('-inf')
+        self.unpainted_pulse_arrival_times = None
+        if config.measure_pulse_latency:
+            self.latency_window = pulse_latency.LatencyWindow()
+            self.distance_label.installEventFilter(self)
+
         self.show()
 
+    def add_torque_plot_samples(self, timestamps, values):
+        slots = (self.torque_plot_next_slot + np.arange(len(timestamps))) % self.PLOT_VISIBLE_SAMPLES
+        new_points = np.column_stack((timestamps, values))
+        self.torque_plot_data[slots] = new_points
+        self.torque_plot_data[slots + self.PLOT_VISIBLE_SAMPLES] = new_points
+        self.torque_plot_next_slot = (self.torque_plot_next_slot + len(timestamps)) % self.PLOT_VISIBLE_SAMPLES
+
     def update_torque_plot(self):
-        self.torque_plot_series.append(self.xdata[-1], self.ydata[-1])
-        self.torque_plot_series.remove(0)
-        self.torque_plot_area_series.lowerSeries().append(self.xdata[-1], 0)
-        self.torque_plot_area_series.lowerSeries().remove(0)
-        self.torque_plot_horizontal_axis.setRange(self.xdata[-1] - self.PLOT_TIME_WINDOW_SECONDS, self.xdata[-1])
-
-    def update_work_plot(self):
-        # Create new bar set
-        new_bar_set = QBarSet(str(self.seen_strokes))
-        value = self.work_per_stroke_data[-1]
-        value_rel = int(value * 255 / self.WORK_PLOT_MAX_Y)
-        new_bar_set.append(value)
-        new_bar_set.setColor(self.COLOR_BLUE)  # QColor(value_rel, value_rel, value_rel))
-        # Append new set, and remove oldest
-        self.work_plot_series.append(new_bar_set)
-        self.work_plot_series.remove(self.work_plot_series.barSets()[0])
-
-    def update_boat_speed_plot(self):
-        # Create new bar set
-        new_bar_set = QBarSet(str(self.seen_strokes))
-        value = self.boat_speed_data[-1]
-        value_rel = int(value * 255 / self.BOAT_SPEED_PLOT_MAX_Y)
-        new_bar_set.append(value)
-        new_bar_set.setColor(self.COLOR_BLUE) # QColor(value_rel, value_rel, value_rel))
-        # Append new set, and remove oldest
-        self.boat_speed_plot_series.append(new_bar_set)
-        self.boat_speed_plot_series.remove(self.boat_speed_plot_series.barSets()[0])
+        # replace() swaps all the points at once, so Qt repaints the series once per frame instead of once per
+        # sample.
+        visible_points = self.torque_plot_data[
+            self.torque_plot_next_slot:self.torque_plot_next_slot + self.PLOT_VISIBLE_SAMPLES
+        ].tolist()
+        self.torque_plot_series.replace([QtCore.QPointF(x, y) for x, y in visible_points])
+        self.torque_plot_area_series.lowerSeries().replace([QtCore.QPointF(x, 0) for x, _ in visible_points])
+        latest_timestamp = visible_points[-1][0]
+        self.torque_plot_horizontal_axis.setRange(latest_timestamp - self.PLOT_TIME_WINDOW_SECONDS, latest_timestamp)
+
+    def update_work_plot(self, value, replace_last_bar=False):
+        # If replace_last_bar is set, the bar of this stroke is already there, showing its provisional drive work.
+        if not replace_last_bar:
+            self.work_plot_latest_slot = (self.work_plot_latest_slot + 1) % self.WORK_PLOT_VISIBLE_STROKES
+        self.work_plot_bar_set_list[self.work_plot_latest_slot].replace(0, value)
+
+    def update_boat_speed_plot(self, value):
+        self.boat_speed_plot_latest_slot = (
+            (self.boat_speed_plot_latest_slot + 1) % self.BOAT_SPEED_PLOT_VISIBLE_STROKES
+        )
+        self.boat_speed_plot_bar_set_list[self.boat_speed_plot_latest_slot].replace(0, value)
 
     def start(self):
         if not self.started:
@@ -390,16 +428,74 @@ class RowingMonitorMainWindow(QtWidgets.QMainWindow):
             self.start_button.setText('Start')
             self.started = False
 
+    def eventFilter(self, watched, event):
+        if watched is self.distance_label and event.type() == QtCore.QEvent.Paint and \
+                self.unpainted_pulse_arrival_times is not None:
+            # The filter runs before the label paints itself, so take the time on the next event loop iteration.
+            QtCore.QTimer.singleShot(0, self.record_frame_latency)
+        return super(RowingMonitorMainWindow, self).eventFilter(watched, event)
+
+    def record_frame_latency(self):
+        if self.unpainted_pulse_arrival_times is None:
+            return
+        self.latency_window.add(time.perf_counter() - self.unpainted_pulse_arrival_times)
+        self.unpainted_pulse_arrival_times = None
+
+    def tag_new_pulses_for_latency(self):
+        new_arrival_times_ts = self.workout.pulse_arrival_times.get_time_slice(
+            start_time=np.nextafter(self.last_timed_pulse_timestamp, np.inf),
+            end_time=np.inf
+        )
+        if len(new_arrival_times_ts) == 0:
+            return
+        self.last_timed_pulse_timestamp = new_arrival_times_ts.timestamps[-1]
+        # Copy, since in separate-process mode the time series is a view into shared memory.
+        new_arrival_times = np.array(new_arrival_times_ts.values)
+        if self.unpainted_pulse_arrival_times is not None:
+            new_arrival_times = np.concatenate((self.unpainted_pulse_arrival_times, new_arrival_times))
+        self.unpainted_pulse_arrival_times = new_arrival_times
+
     def start_workout(self):
         self.timer.start()
-        self.workout.start(qt_signal_emitter=self.workout_qt_emitter)
+        self.frame_timer.start()
+        if self.acquisition_process is not None:
+            self.acquisition_process.start()
+            return
+        self.workout.start()
 
     def stop_workout(self):
         self.timer.stop()
+        self.frame_timer.stop()
+        if self.latency_window is not None and not self.DISABLE_LOGGING and not DEV_MODE:
+            timestamp = datetime.datetime.now().strftime("%Y-%m-%d %Hh%Mm%Ss")
+            self.latency_window.save(os.path.join(self.log_folder_path, timestamp + '_pulse_latency.json'))
+        if self.acquisition_process is not None:
+            # The acquisition process saves the workout log itself.
+            self.acquisition_process.stop()
+            return
         self.workout.stop()
         if not self.DISABLE_LOGGING and not DEV_MODE:
             self.workout.save(output_folder_path=self.log_folder_path)
 
+    def _has_new_data(self):
+        if self.acquisition_process is not None:
+            return self.workout.has_updates()
+        num_pulses = len(self.workout.boat.position)
+        result = num_pulses > self.num_pulses_seen
+        self.num_pulses_seen = num_pulses
+        return result
+
+    def closeEvent(self, event):
+        if self.acquisition_process is not None:
+            # Releases the shared memory.
+            self.acquisition_process.close()
+        else:
+            # The window can be closed mid-workout, and stopping an already stopped workout is harmless. The spill
+            # files are only released here so that Start can resume the workout after Stop.
+            self.workout.stop()
+            self.workout.close()
+        super(RowingMonitorMainWindow, self).closeEvent(event)
+
     def _format_total_workout_time(self, value_seconds):
         minutes = value_seconds // 60
         seconds = value_seconds % 60
@@ -421,39 +517,54 @@ class RowingMonitorMainWindow(QtWidgets.QMainWindow):
         return '%s /500m' % (self._format_total_workout_time(value_seconds))
 
     def ui_callback(self):
+        """Draws one frame with all the data that arrived since the previous one."""
+        if not self._has_new_data():
+            return
         # If this is the first pulse, capture the current time
         if self.start_timestamp is None:
             self.start_timestamp = QtCore.QTime.currentTime()
         # Update distance
         distance = self.workout.boat.position.values[-1]
         self.distance_label.setText(self._format_total_workout_distance(distance))
-        if len(self.workout.person.torque) > 0:
-            self.ydata = self.ydata[1:] + [self.workout.person.torque.values[-1]]
-            self.xdata = self.xdata[1:] + [self.workout.person.torque.timestamps[-1]]
+        if self.latency_window is not None:
+            self.tag_new_pulses_for_latency()
+        # Torque samples after the last one we plotted. Only the most recent ones fit in the plot.
+        new_torque_samples_ts = self.workout.person.torque.get_time_slice(
+            start_time=np.nextafter(self.last_plotted_torque_timestamp, np.inf),
+            end_time=np.inf
+        )[-self.PLOT_VISIBLE_SAMPLES:]
+        if len(new_torque_samples_ts) > 0:
+            self.add_torque_plot_samples(new_torque_samples_ts.timestamps, new_torque_samples_ts.values)
+            self.last_plotted_torque_timestamp = new_torque_samples_ts.timestamps[-1]
             self.update_torque_plot()
         # Update SPM
-        new_stroke_info_available = len(self.workout.person.strokes) > self.seen_strokes
+        # Strokes past num_completed_strokes don't have their boat metrics yet.
+        num_strokes = self.workout.num_completed_strokes
+        strokes = self.workout.person.strokes
+        new_stroke_info_available = num_strokes > self.seen_strokes
         if new_stroke_info_available:
-            # SPM indicator
-            spm = 60 / self.workout.person.strokes.values[-1].duration
-            ratio = self.workout.person.strokes.values[-1].drive_to_recovery_ratio
+            # Several strokes can end between two frames, and every one of them gets its bars.
+            for stroke_idx in range(self.seen_strokes, num_strokes):
+                stroke = strokes[stroke_idx]
+                # Work plot. Only the latest bar can be the provisional drive work of this stroke.
+                drive_already_shown = stroke_idx < self.seen_drives
+                self.update_work_plot(value=stroke.work_done_by_person, replace_last_bar=drive_already_shown)
+                # Boat speed plot
+                self.update_boat_speed_plot(value=stroke.average_boat_speed)
+            self.seen_strokes = num_strokes
+            self.seen_drives = max(self.seen_drives, num_strokes)
+            # The indicators show the latest stroke.
+            latest_stroke = strokes[num_strokes - 1]
+            spm = 60 / latest_stroke.duration
             self.spm_label.setText(self._format_strokes_per_minute(spm))
-            self.stroke_ratio_label.setText(self._format_stroke_ratio(ratio))
-            # Work plot
-            self.work_per_stroke_data = self.work_per_stroke_data[1:] + \
-                                        [self.workout.person.strokes.values[-1].work_done_by_person]
-            self.update_work_plot()
-            self.seen_strokes += 1
-            # Boat speed plot
-            average_boat_speed = self.workout.boat.speed.get_average_value(
-                start_time=self.workout.person.strokes.values[-1].start_time,
-                end_time=self.workout.person.strokes.values[-1].end_time
-            )
-            self.boat_speed_data = self.boat_speed_data[1:] + [average_boat_speed]
-            self.boat_speed_label.setText(self._format_boat_speed(average_boat_speed))
-            split_time_seconds = 500.0 / average_boat_speed
-            self.split_time_label.setText(self._format_boat_pace(split_time_seconds))
-            self.update_boat_speed_plot()
+            self.stroke_ratio_label.setText(self._format_stroke_ratio(latest_stroke.drive_to_recovery_ratio))
+            self.boat_speed_label.setText(self._format_boat_speed(latest_stroke.average_boat_speed))
+            self.split_time_label.setText(self._format_boat_pace(latest_stroke.split_time))
+        # Show the drive work as soon as the drive is over, without waiting for the end of the stroke
+        last_drive = self.workout.person.last_drive
+        if last_drive is not None and last_drive.stroke_idx >= self.seen_drives:
+            self.update_work_plot(value=last_drive.work_done_by_person)
+            self.seen_drives = last_drive.stroke_idx + 1
 
     def timer_tick(self):
         # Do nothing if we haven't received an encoder pulse yet.
@@ -462,27 +573,40 @@ class RowingMonitorMainWindow(QtWidgets.QMainWindow):
         # Update workout time label
         time_since_start = self.start_timestamp.secsTo(QtCore.QTime.currentTime())
         self.time_label.setText(self._format_total_workout_time(time_since_start))
-
-
-app_config = cf.load_config()
-if DEV_MODE:
-    app_data_source = ds.CsvFile(
-        "C:\\Users\\checo\\Desktop\\rower\\2020-08-28 22h49m22s.csv",
-        sample_delay=True,
-        threaded=True
-    )
-else:
-    app_data_source = ds.PiGpioClient(
-        ip_address=app_config.ip_address,
-        pigpio_port=app_config.pigpio_daemon_port,
-        gpio_pin_number=app_config.gpio_pin_numer
-    )
-print('Connected!')
-app = QtWidgets.QApplication(sys.argv)
-pal = app.palette()
-pal.setColor(QtGui.QPalette.Window, QtCore.Qt.white)
-app.setPalette(pal)
-
-w = RowingMonitorMainWindow(app_config, app_data_source)
-w.resize(700, 700)
-app.exec_()
+        if self.latency_window is not None and len(self.latency_window) > 0:
+            latency_summary = self.latency_window.get_summary()
+            self.latency_label.setText('Latency p50 %.0f ms, p99 %.0f ms, max %.0f ms' % (
+                1000 * latency_summary['p50'], 1000 * latency_summary['p99'], 1000 * latency_summary['max']
+            ))
+
+
+# The acquisition process re-imports this module when it's spawned, so the app must only start when run as a script.
+if __name__ == '__main__':
+    app_config = cf.load_config()
+    # A factory rather than a data source, since in separate-process mode the data source is built in the
+    # acquisition process.
+    if DEV_MODE:
+        app_data_source_factory = functools.partial(
+            ds.CsvFile,
+            "C:\\Users\\checo\\Desktop\\rower\\2020-08-28 22h49m22s.csv",
+            sample_delay=True,
+            threaded=True
+        )
+    else:
+        app_data_source_factory = functools.partial(
+            ds.PiGpioClient,
+            ip_address=app_config.ip_address,
+            pigpio_port=app_config.pigpio_daemon_port,
+            gpio_pin_number=app_config.gpio_pin_numer,
+            acquisition_queue_capacity=app_config.acquisition_queue_capacity,
+            use_notification_stream=app_config.use_pigpio_notification_stream
+        )
+    print('Connected!')
+    app = QtWidgets.QApplication(sys.argv)
+    pal = app.palette()
+    pal.setColor(QtGui.QPalette.Window, QtCore.Qt.white)
+    app.setPalette(pal)
+
+    w = RowingMonitorMainWindow(app_config, app_data_source_factory)
+    w.resize(700, 700)
+    app.exec_()
@@ -0,0 +1,235 @@
+"""Measures the throughput and per-call latency of the metrics pipeline components at several workout session lengths,
+and writes the results to a JSON file so runs can be compared against each other.
+
+Run from the repository root with:
+    python -m benchmarks.pipeline [--minutes 5 60 240] [--output pipeline_benchmark.json]
+"""
+import argparse
+import datetime
+import json
+import platform
+import sys
+import time
+
+import numpy as np
+
+from rower_monitor import config_loader as cf
+from rower_monitor import data_sources as ds
+from rower_monitor import machine_metrics
+from rower_monitor import person_metrics
+from rower_monitor import workout as wo
+from rower_monitor.time_series import TimeSeries
+
+SESSION_LENGTHS_MINUTES = [5, 60, 240]
+NUM_ENCODER_PULSES_PER_REVOLUTION = 4
+STROKES_PER_MINUTE = 24
+RANDOM_SEED = 0
+# Pulses per process_batch call in the batch replay, about what the acquisition queue worker drains at a time.
+BATCH_SIZE = 64
+# The per-stroke benchmarks run on this many of the most recent strokes of the session.
+NUM_MEASURED_STROKES = 200
+OUTPUT_FILE_PATH = 'pipeline_benchmark.json'
+
+
+def build_raw_ticks(duration_seconds):
+    """Returns the raw tick values of a simulated session. The seed is fixed, so every run replays the same pulses."""
+    simulated_rower = ds.SimulatedRower(
+        num_encoder_pulses_per_revolution=NUM_ENCODER_PULSES_PER_REVOLUTION,
+        strokes_per_minute=STROKES_PER_MINUTE,
+        random_seed=RANDOM_SEED,
+    )
+    return simulated_rower.simulate_raw_ticks(duration_seconds)
+
+
+def new_workout(enable_stage_timing=False):
+    config = cf.Config(
+        ip_address=None,
+        pigpio_daemon_port=None,
+        gpio_pin_numer=None,
+        num_flywheel_encoder_pulses_per_revolution=NUM_ENCODER_PULSES_PER_REVOLUTION,
+        machine_type='magnetic',
+        flywheel_moment_of_inertia=1.0,
+        log_folder_path=None,
+        damping_model_estimator_class=machine_metrics.LinearDampingFactorEstimator,
+        enable_stage_timing=enable_stage_timing,
+    )
+    # The data source is only used to convert raw ticks to timestamps, so it never connects to the pigpio daemon.
+    data_source = ds.PiGpioClient(ip_address=None, pigpio_port=None, gpio_pin_number=None)
+    return wo.WorkoutMetricsTracker(config=config, data_source=data_source)
+
+
+def summarize_durations(durations):
+    durations = np.asarray(durations)
+    p50, p99 = np.percentile(durations, [50, 99]).tolist()
+    return {
+        'num_calls': len(durations),
+        'calls_per_second': len(durations) / durations.sum().item(),
+        'mean_us': 1e6 * durations.mean().item(),
+        'p50_us': 1e6 * p50,
+        'p99_us': 1e6 * p99,
+        'max_us': 1e6 * durations.max().item(),
+    }
+
+
+def measure_calls(function, arguments):
+    """Calls function once per tuple in arguments, timing each call on its own."""
+    durations = np.empty(len(arguments))
+    perf_counter = time.perf_counter
+    for call_idx, call_arguments in enumerate(arguments):
+        start_time = perf_counter()
+        function(*call_arguments)
+        durations[call_idx] = perf_counter() - start_time
+    return summarize_durations(durations)
+
+
+def benchmark_replays(raw_ticks):
+    results = {}
+    # Per-pulse replay, the way the pigpio callback feeds the trackers. Stage timing is on, so the throughput
+    # includes its overhead.
+    workout = new_workout(enable_stage_timing=True)
+    sensor_pulse_times = workout.data_source.get_timestamps_from_raw_ticks(raw_ticks).tolist()
+    start_time = time.perf_counter()
+    for sensor_pulse_time, raw_tick_value in zip(sensor_pulse_times, raw_ticks.tolist()):
+        workout.flywheel_sensor_pulse_handler(sensor_pulse_time, raw_tick_value)
+    elapsed_seconds = time.perf_counter() - start_time
+    results['replay_per_pulse'] = {
+        'num_pulses': len(raw_ticks),
+        'elapsed_seconds': elapsed_seconds,
+        'pulses_per_second': len(raw_ticks) / elapsed_seconds,
+    }
+    for stage in workout.pulse_stage_timer.stages + ('total',):
+        results['pulse_handler_stage_' + stage] = {
+            'p50_us': 1e6 * workout.pulse_stage_timer.get_percentile(stage, 50),
+            'p99_us': 1e6 * workout.pulse_stage_timer.get_percentile(stage, 99),
+            'max_us': 1e6 * workout.pulse_stage_timer.get_max(stage),
+        }
+
+    batch_workout = new_workout()
+    start_time = time.perf_counter()
+    for batch_start_idx in range(0, len(raw_ticks), BATCH_SIZE):
+        batch_workout.process_batch(raw_ticks[batch_start_idx:batch_start_idx + BATCH_SIZE])
+    elapsed_seconds = time.perf_counter() - start_time
+    results['replay_batch'] = {
+        'num_pulses': len(raw_ticks),
+        'batch_size': BATCH_SIZE,
+        'elapsed_seconds': elapsed_seconds,
+        'pulses_per_second': len(raw_ticks) / elapsed_seconds,
+    }
+    return workout, results
+
+
+def benchmark_batch_stages(raw_ticks):
+    """Times the machine, person and boat stages of each BATCH_SIZE batch on their own, the same way
+    WorkoutMetricsTracker.process_batch runs them. The person stage includes the damping metrics and the synchronous
+    damping model fit of every stroke that ends in the batch."""
+    workout = new_workout()
+    sensor_pulse_times = workout.data_source.get_timestamps_from_raw_ticks(raw_ticks)
+    num_batches = (len(raw_ticks) + BATCH_SIZE - 1) // BATCH_SIZE
+    machine_durations = np.empty(num_batches)
+    person_durations = np.empty(num_batches)
+    boat_durations = np.empty(num_batches)
+    perf_counter = time.perf_counter
+    for batch_idx in range(num_batches):
+        batch_slice = slice(batch_idx * BATCH_SIZE, (batch_idx + 1) * BATCH_SIZE)
+        first_new_pulse_idx = len(workout.machine.encoder_pulses)
+        first_new_acceleration_idx = len(workout.machine.flywheel_acceleration)
+        start_time = perf_counter()
+        workout.machine.update_flywheel_metrics_batch(
+            sensor_pulse_times=sensor_pulse_times[batch_slice],
+            raw_tick_values=raw_ticks[batch_slice]
+        )
+        machine_end_time = perf_counter()
+        workout.person.process_batch(
+            first_new_acceleration_idx=first_new_acceleration_idx,
+            synchronous_damping_model_fits=True
+        )
+        person_end_time = perf_counter()
+        workout.boat.process_batch(first_new_pulse_idx=first_new_pulse_idx)
+        boat_end_time = perf_counter()
+        machine_durations[batch_idx] = machine_end_time - start_time
+        person_durations[batch_idx] = person_end_time - machine_end_time
+        boat_durations[batch_idx] = boat_end_time - person_end_time
+    return {
+        'MachineMetricsTracker.update_flywheel_metrics_batch': summarize_durations(machine_durations),
+        'PersonMetricsTracker.process_batch': summarize_durations(person_durations),
+        'RotatingWheel.process_batch': summarize_durations(boat_durations),
+    }
+
+
+def benchmark_components(workout):
+    results = {}
+    flywheel_speed = workout.machine.flywheel_speed
+    strokes = workout.person.strokes
+    measured_strokes = [strokes[stroke_idx] for stroke_idx in range(max(len(strokes) - NUM_MEASURED_STROKES, 0),
+                                                                    len(strokes))]
+    stroke_windows = [(stroke.start_time, stroke.end_time) for stroke in measured_strokes]
+
+    # Appending to a series that grows to the session's length, including the buffer doublings.
+    time_series = TimeSeries()
+    results['TimeSeries.append'] = measure_calls(
+        time_series.append, list(zip(flywheel_speed.values.tolist(), flywheel_speed.timestamps.tolist()))
+    )
+    results['TimeSeries.get_time_slice'] = measure_calls(flywheel_speed.get_time_slice, stroke_windows)
+    results['TimeSeries.get_average_value'] = measure_calls(workout.boat.speed.get_average_value, stroke_windows)
+    stroke_speed_samples = [(flywheel_speed[stroke.start_idx:stroke.end_idx + 1],) for stroke in measured_strokes]
+    results['TimeSeries.interpolate_midpoints'] = measure_calls(TimeSeries.interpolate_midpoints, stroke_speed_samples)
+
+    stroke_table = person_metrics.StrokeTable()
+    stroke_rows = [
+        {name: strokes.get_column(name)[stroke_idx].item() for name in person_metrics.StrokeTable.COLUMNS}
+        for stroke_idx in range(len(strokes))
+    ]
+    results['StrokeTable.append'] = measure_calls(
+        lambda row: stroke_table.append(**row), [(row,) for row in stroke_rows]
+    )
+
+    damping_model_estimator = machine_metrics.LinearDampingFactorEstimator(workout)
+    results['LinearDampingFactorEstimator.fit_model_to_stroke_recovery_data'] = measure_calls(
+        damping_model_estimator.fit_model_to_stroke_recovery_data, [(stroke,) for stroke in measured_strokes]
+    )
+    return results
+
+
+def run_session(duration_minutes):
+    raw_ticks = build_raw_ticks(duration_minutes * 60)
+    workout, results = benchmark_replays(raw_ticks)
+    results.update(benchmark_batch_stages(raw_ticks))
+    results.update(benchmark_components(workout))
+    return {
+        'minutes': duration_minutes,
+        'num_pulses': len(raw_ticks),
+        'num_strokes': len(workout.person.strokes),
+        'benchmarks': results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--minutes', type=float, nargs='+', default=SESSION_LENGTHS_MINUTES)
+    parser.add_argument('--output', default=OUTPUT_FILE_PATH)
+    args = parser.parse_args()
+
+    sessions = []
+    for duration_minutes in args.minutes:
+        session = run_session(duration_minutes)
+        sessions.append(session)
+        print('%g minutes, %d pulses, %d strokes' % (duration_minutes, session['num_pulses'], session['num_strokes']))
+        for name, result in session['benchmarks'].items():
+            if 'pulses_per_second' in result:
+                print('  %-70s %12.0f pulses/s' % (name, result['pulses_per_second']))
+            else:
+                print('  %-70s %10.2f us p50 %10.2f us p99' % (name, result['p50_us'], result['p99_us']))
+
+    with open(args.output, 'w') as output_file:
+        json.dump({
+            'created': datetime.datetime.now().isoformat(),
+            'python_version': sys.version,
+            'numpy_version': np.__version__,
+            'platform': platform.platform(),
+            'sessions': sessions,
+        }, output_file, indent=2)
+    print('Results written to %s' % args.output)
+
+
+if __name__ == '__main__':
+    main()
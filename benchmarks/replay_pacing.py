@@ -0,0 +1,83 @@
+"""Checks that CSV replays keep their recorded pace: replays a simulated session at several speed multipliers and
+compares the wall time it took, and the statistics ReplayScheduler reports, against the recorded duration.
+
+Run from the repository root with:
+    python -m benchmarks.replay_pacing [--seconds 20] [--speeds 1 4 20]
+
+Exits with status 1 if any replay is off by more than the tolerance.
+"""
+import argparse
+import csv
+import os
+import sys
+import tempfile
+import time
+
+from rower_monitor import data_sources as ds
+
+SESSION_LENGTH_SECONDS = 20
+SPEED_MULTIPLIERS = [1, 4, 20]
+RANDOM_SEED = 0
+# How far the achieved speed multiplier and the replay's wall time may be from what they should be.
+RELATIVE_TOLERANCE = 0.01
+# Sleeping is only accurate to about a millisecond, plus whatever the OS scheduler adds.
+MAX_LATENESS_SECONDS = 0.02
+
+
+def write_session(file_path, duration_seconds):
+    """Writes a simulated session to a CSV file in the workout log format, and returns its recorded duration."""
+    simulated_rower = ds.SimulatedRower(random_seed=RANDOM_SEED)
+    raw_ticks = simulated_rower.simulate_raw_ticks(duration_seconds)
+    with open(file_path, 'w', newline='') as output_file:
+        csv_writer = csv.writer(output_file)
+        csv_writer.writerow([ds.CsvFile.RAW_TICKS_COLUMN_NAME])
+        csv_writer.writerows([[raw_tick_value] for raw_tick_value in raw_ticks.tolist()])
+    timestamps = simulated_rower.get_timestamps_from_raw_ticks(raw_ticks)
+    return (timestamps[-1] - timestamps[0]).item()
+
+
+def check_replay(file_path, recorded_duration_seconds, speed_multiplier):
+    csv_file = ds.CsvFile(file_path, sample_delay=True, threaded=False, replay_speed=speed_multiplier)
+    start_time = time.monotonic()
+    csv_file.start(sensor_pulse_event_handler_callback=lambda sensor_pulse_time, raw_tick_value: None)
+    elapsed_seconds = time.monotonic() - start_time
+    statistics = csv_file.get_replay_statistics()
+    expected_elapsed_seconds = recorded_duration_seconds / speed_multiplier
+    failures = []
+    if abs(statistics['achieved_speed_multiplier'] / speed_multiplier - 1) > RELATIVE_TOLERANCE:
+        failures.append('achieved speed multiplier %.4f' % statistics['achieved_speed_multiplier'])
+    if abs(elapsed_seconds / expected_elapsed_seconds - 1) > RELATIVE_TOLERANCE:
+        failures.append('took %.3f s instead of %.3f s' % (elapsed_seconds, expected_elapsed_seconds))
+    if statistics['max_lateness'] > MAX_LATENESS_SECONDS:
+        failures.append('max lateness %.1f ms' % (1000 * statistics['max_lateness']))
+    return elapsed_seconds, statistics, failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=SESSION_LENGTH_SECONDS)
+    parser.add_argument('--speeds', type=float, nargs='+', default=SPEED_MULTIPLIERS)
+    args = parser.parse_args()
+
+    num_failures = 0
+    with tempfile.TemporaryDirectory() as folder_path:
+        file_path = os.path.join(folder_path, 'session.csv')
+        recorded_duration_seconds = write_session(file_path, args.seconds)
+        for speed_multiplier in args.speeds:
+            elapsed_seconds, statistics, failures = check_replay(
+                file_path, recorded_duration_seconds, speed_multiplier
+            )
+            print('x%-6g %8.3f s  achieved x%-9.4f p99 lateness %6.2f ms  max lateness %6.2f ms  %s' % (
+                speed_multiplier,
+                elapsed_seconds,
+                statistics['achieved_speed_multiplier'],
+                1000 * statistics['recent_lateness_p99'],
+                1000 * statistics['max_lateness'],
+                'FAILED: ' + ', '.join(failures) if failures else 'ok',
+            ))
+            num_failures += len(failures) > 0
+    sys.exit(1 if num_failures > 0 else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""Measures the per-stroke cost of TimeSeries.get_time_slice as a workout session grows.
+
+Run from the repository root with:
+    python -m benchmarks.time_slice
+"""
+import timeit
+
+import numpy as np
+
+from rower_monitor.time_series import TimeSeries
+
+SAMPLES_PER_SECOND = 50
+STROKE_DURATION_SECONDS = 2.5
+SESSION_LENGTHS_MINUTES = [5, 15, 30, 60, 120]
+NUM_REPETITIONS = 200
+
+
+def linear_scan_time_slice(time_series, start_time, end_time):
+    """The original mask-based implementation, kept here as a reference point."""
+    included_mask = [start_time <= i <= end_time for i in time_series.timestamps]
+    try:
+        first_included_item_idx = included_mask.index(True)
+    except ValueError:
+        return TimeSeries()
+    last_included_item_idx = len(included_mask) - included_mask[::-1].index(True)
+    return time_series[first_included_item_idx: last_included_item_idx]
+
+
+def build_session(duration_minutes):
+    num_samples = int(duration_minutes * 60 * SAMPLES_PER_SECOND)
+    timestamps = np.arange(num_samples) / SAMPLES_PER_SECOND
+    values = np.sin(timestamps)
+    time_series = TimeSeries()
+    for value, timestamp in zip(values.tolist(), timestamps.tolist()):
+        time_series.append(value, timestamp)
+    return time_series
+
+
+def time_per_call_us(function, num_repetitions):
+    return 1e6 * min(timeit.repeat(function, number=num_repetitions, repeat=3)) / num_repetitions
+
+
+def main():
+    print('%10s %12s %18s %18s' % ('minutes', 'samples', 'binary search [us]', 'linear scan [us]'))
+    for duration_minutes in SESSION_LENGTHS_MINUTES:
+        time_series = build_session(duration_minutes)
+        # Query the most recent stroke, the same way the trackers and the GUI do.
+        end_time = time_series.timestamps[-1]
+        start_time = end_time - STROKE_DURATION_SECONDS
+        binary_search_us = time_per_call_us(
+            lambda: time_series.get_time_slice(start_time, end_time), NUM_REPETITIONS
+        )
+        linear_scan_us = time_per_call_us(
+            lambda: linear_scan_time_slice(time_series, start_time, end_time), 3
+        )
+        print('%10d %12d %18.2f %18.2f' % (duration_minutes, len(time_series), binary_search_us, linear_scan_us))
+
+
+if __name__ == '__main__':
+    main()
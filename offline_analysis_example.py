@@ -13,8 +13,9 @@ csv_source = ds.CsvFile(
 
 config_data = cf.load_config()
 workout = wo.WorkoutMetricsTracker(config=config_data, data_source=csv_source)
-workout.start()
-workout.stop()
+# Replay the whole log in one go through the vectorized path. This gives the same results as workout.start(), which
+# feeds the ticks to the trackers one at a time.
+workout.process_batch(csv_source.read_raw_ticks())
 
 
 print(workout.boat.position.values[-1])
@@ -0,0 +1,222 @@
+import multiprocessing
+
+import numpy as np
+
+from . import workout as wo
+from .person_metrics import DriveMetrics, StrokeTable
+from .shared_memory_ring import SharedMemoryRing
+from .time_series import TimeSeries
+
+PULSE_DTYPE = np.dtype([
+    ('timestamp', np.float64),
+    ('raw_ticks', np.int64),
+    ('boat_position', np.float64),
+    ('arrival_time', np.float64),
+])
+TORQUE_DTYPE = np.dtype([('timestamp', np.float64), ('value', np.float64)])
+STROKE_DTYPE = np.dtype(
+    [(name, np.int64) for name in StrokeTable.INDEX_COLUMNS] +
+    [(name, np.float64) for name in StrokeTable.VALUE_COLUMNS]
+)
+DRIVE_DTYPE = np.dtype([('stroke_idx', np.int64)] + [(name, np.float64) for name in DriveMetrics._fields[1:]])
+
+# Row dtype and number of rows of each ring. The stroke ring is sized so it never wraps around in a realistic session
+# (a 4-hour row at 30 spm is 7200 strokes), which keeps stroke counts and indices meaningful on the reader side.
+RING_LAYOUTS = {
+    'pulses': (PULSE_DTYPE, 1 << 16),
+    'torque': (TORQUE_DTYPE, 1 << 16),
+    'strokes': (STROKE_DTYPE, 1 << 15),
+    'drives': (DRIVE_DTYPE, 64),
+}
+
+
+class SharedMemoryPublisher:
+    """Copies the samples and strokes a WorkoutMetricsTracker produced since the last call into the shared memory
+    rings. Meant to be used as the workout's ui_callback in the acquisition process."""
+
+    def __init__(self, rings):
+        self.rings = rings
+        self._num_published_pulses = 0
+        self._num_published_torque_samples = 0
+        self._num_published_strokes = 0
+        self._last_published_drive = None
+
+    def publish(self, workout):
+        encoder_pulses = workout.machine.encoder_pulses
+        num_pulses = min(len(encoder_pulses), len(workout.boat.position))
+        if num_pulses > self._num_published_pulses:
+            new_pulses_ts = encoder_pulses[self._num_published_pulses:num_pulses]
+            rows = self.rings['pulses'].new_rows(len(new_pulses_ts))
+            rows['timestamp'] = new_pulses_ts.timestamps
+            rows['raw_ticks'] = new_pulses_ts.values
+            rows['boat_position'] = workout.boat.position[self._num_published_pulses:num_pulses].values
+            if workout.measure_pulse_latency:
+                rows['arrival_time'] = workout.pulse_arrival_times[self._num_published_pulses:num_pulses].values
+            else:
+                rows['arrival_time'] = np.nan
+            self.rings['pulses'].append(rows)
+            self._num_published_pulses = num_pulses
+
+        torque = workout.person.torque
+        if len(torque) > self._num_published_torque_samples:
+            new_torque_ts = torque[self._num_published_torque_samples:]
+            rows = self.rings['torque'].new_rows(len(new_torque_ts))
+            rows['timestamp'] = new_torque_ts.timestamps
+            rows['value'] = new_torque_ts.values
+            self.rings['torque'].append(rows)
+            self._num_published_torque_samples = len(torque)
+
+        strokes = workout.person.strokes
+        num_strokes = workout.num_completed_strokes
+        if num_strokes > self._num_published_strokes:
+            rows = self.rings['strokes'].new_rows(num_strokes - self._num_published_strokes)
+            for name in StrokeTable.COLUMNS:
+                rows[name] = strokes.get_column(name)[self._num_published_strokes:num_strokes]
+            self.rings['strokes'].append(rows)
+            self._num_published_strokes = num_strokes
+
+        last_drive = workout.person.last_drive
+        if last_drive is not None and last_drive is not self._last_published_drive:
+            rows = self.rings['drives'].new_rows(1)
+            rows[0] = tuple(last_drive)
+            self.rings['drives'].append(rows)
+            self._last_published_drive = last_drive
+
+
+class SharedMemoryWorkoutView:
+    """The read-only slice of the WorkoutMetricsTracker interface that the GUI uses, backed by the shared memory
+    rings. Every attribute access returns numpy views straight into shared memory."""
+
+    def __init__(self, rings):
+        self.rings = rings
+        self.person = _PersonView(rings)
+        self.boat = _BoatView(rings)
+        self._seen_counts = {name: 0 for name in rings}
+
+    @property
+    def num_completed_strokes(self):
+        # Only strokes with their boat metrics filled in are published.
+        return len(self.person.strokes)
+
+    @property
+    def pulse_arrival_times(self):
+        rows = self.rings['pulses'].get_latest()
+        return TimeSeries._view(values=rows['arrival_time'], timestamps=rows['timestamp'])
+
+    def has_updates(self):
+        """Returns True if the acquisition process published anything since the last call."""
+        counts = {name: ring.count for name, ring in self.rings.items()}
+        result = counts != self._seen_counts
+        self._seen_counts = counts
+        return result
+
+
+class _PersonView:
+    def __init__(self, rings):
+        self._rings = rings
+
+    @property
+    def torque(self):
+        rows = self._rings['torque'].get_latest()
+        return TimeSeries._view(values=rows['value'], timestamps=rows['timestamp'])
+
+    @property
+    def strokes(self):
+        rows = self._rings['strokes'].get_latest()
+        return StrokeTable._view(
+            columns={name: rows[name] for name in StrokeTable.COLUMNS},
+            size=len(rows)
+        )
+
+    @property
+    def last_drive(self):
+        rows = self._rings['drives'].get_latest(1)
+        if len(rows) == 0:
+            return None
+        return DriveMetrics(*rows[0].tolist())
+
+
+class _BoatView:
+    def __init__(self, rings):
+        self._rings = rings
+
+    @property
+    def position(self):
+        rows = self._rings['pulses'].get_latest()
+        return TimeSeries._view(values=rows['boat_position'], timestamps=rows['timestamp'])
+
+
+def _run_acquisition(config, data_source_factory, ring_names, ring_locks, stop_event, log_folder_path):
+    rings = {
+        name: SharedMemoryRing(dtype=dtype, capacity=capacity, name=ring_names[name], lock=ring_locks[name])
+        for name, (dtype, capacity) in RING_LAYOUTS.items()
+    }
+    publisher = SharedMemoryPublisher(rings)
+    workout = wo.WorkoutMetricsTracker(config=config, data_source=data_source_factory())
+    workout.start(ui_callback=publisher.publish)
+    stop_event.wait()
+    workout.stop()
+    publisher.publish(workout)
+    if log_folder_path is not None:
+        workout.save(output_folder_path=log_folder_path)
+    workout.close()
+    for ring in rings.values():
+        ring.close()
+
+
+class AcquisitionProcess:
+    """Runs the data source and the WorkoutMetricsTracker in a separate process, so the GUI doesn't compete with
+    pulse processing for the GIL. The results are published to shared memory rings, and workout_view exposes them
+    to the GUI without copying or pickling.
+
+    data_source_factory is called in the acquisition process to build the data source, so it must be picklable,
+    e.g. a functools.partial of a DataSource class."""
+
+    def __init__(self, config, data_source_factory, log_folder_path=None):
+        self.config = config
+        self.data_source_factory = data_source_factory
+        self.log_folder_path = log_folder_path
+        # Spawn rather than fork, so the child doesn't inherit the GUI's threads and Qt state.
+        self._context = multiprocessing.get_context('spawn')
+        self.rings = {
+            name: SharedMemoryRing(
+                dtype=dtype,
+                capacity=capacity,
+                create=True,
+                read_only=True,
+                lock=self._context.Lock()
+            )
+            for name, (dtype, capacity) in RING_LAYOUTS.items()
+        }
+        self.workout_view = SharedMemoryWorkoutView(self.rings)
+        self._stop_event = None
+        self._process = None
+
+    def start(self):
+        self._stop_event = self._context.Event()
+        self._process = self._context.Process(
+            target=_run_acquisition,
+            args=(
+                self.config,
+                self.data_source_factory,
+                {name: ring.name for name, ring in self.rings.items()},
+                {name: ring.lock for name, ring in self.rings.items()},
+                self._stop_event,
+                self.log_folder_path,
+            ),
+            daemon=True,
+        )
+        self._process.start()
+
+    def stop(self):
+        """Stops the acquisition process, after it has saved the workout log."""
+        if self._process is None:
+            return
+        self._stop_event.set()
+        self._process.join()
+        self._process = None
+
+    def close(self):
+        self.stop()
+        for ring in self.rings.values():
+            ring.close()
@@ -1,17 +1,135 @@
-from .time_series import TimeSeries
+import collections
+
+import numpy as np
 
 
 class BoatModel:
+    SPLIT_DISTANCE_METERS = 500.0
 
     def __init__(self, workout):
         self.workout = workout
-        self.position = TimeSeries()
-        self.speed = TimeSeries()
+        self.position = workout.new_time_series('boat_position')
+        # The integral index keeps rolling speed averages cheap for the whole session.
+        self.speed = workout.new_time_series('boat_speed', track_integral=True)
+
+        # Running integral of the boat speed over time, i.e. distance traveled, up to the latest speed sample. It's
+        # accumulated the same way as the speed time series' integral index.
+        self._distance_integral = 0.0
+        self._num_integrated_speed_samples = 0
+        # (index, distance integral, timestamp) of the last few speed samples. A stroke ends 2 samples before the
+        # latest one, so this is all the history we need to close it.
+        self._recent_distance_integrals = collections.deque(maxlen=3)
+        self._num_strokes_with_boat_metrics = 0
+        # Speed sample i sits between acceleration samples i - 1 and i, so a stroke starting at acceleration sample
+        # start_idx covers speed samples start_idx + 1 to end_idx.
+        self._ongoing_stroke_first_speed_idx = 1
+        self._ongoing_stroke_start_distance_integral = None
+        self._ongoing_stroke_start_time = None
 
     def update(self):
         """This function gets called on every flywheel encoder tick."""
         pass
 
+    def process_batch(self, first_new_pulse_idx):
+        """This function gets called after a batch of flywheel encoder ticks, starting at first_new_pulse_idx, was
+        processed by the vectorized path. It must leave the model in the same state as calling update() once per
+        tick."""
+        pass
+
+    def _update_stroke_metrics(self):
+        """Integrates new boat speed samples and fills in the boat metrics of strokes that just ended. Subclasses
+        call this at the end of update(), after appending their speed samples."""
+        speed_values = self.speed.values
+        speed_timestamps = self.speed.timestamps
+        for idx in range(self._num_integrated_speed_samples, len(self.speed)):
+            if idx > 0:
+                self._distance_integral += speed_values[idx - 1] * (speed_timestamps[idx] - speed_timestamps[idx - 1])
+            self._add_distance_integral_sample(idx, self._distance_integral, speed_timestamps[idx])
+        self._num_integrated_speed_samples = len(self.speed)
+        self._close_new_strokes()
+
+    def _update_stroke_metrics_batch(self):
+        """Vectorized equivalent of _update_stroke_metrics, for the end of process_batch()."""
+        first_idx = self._num_integrated_speed_samples
+        num_samples = len(self.speed)
+        if first_idx >= num_samples:
+            self._close_new_strokes()
+            return
+        speed_samples_ts = self.speed[max(first_idx - 1, 0):]
+        values = speed_samples_ts.values
+        timestamps = speed_samples_ts.timestamps
+        increments = values[:-1] * np.diff(timestamps)
+        if first_idx == 0:
+            increments = np.concatenate(([0.0], increments))
+        # np.cumsum adds sequentially, so this matches the running sum computed by _update_stroke_metrics.
+        distance_integrals = np.cumsum(np.concatenate(([self._distance_integral], increments)))[1:]
+        timestamps = timestamps[-len(distance_integrals):]
+        self._distance_integral = distance_integrals[-1].item()
+        self._num_integrated_speed_samples = num_samples
+        self._close_new_strokes(batch_first_idx=first_idx, batch_distance_integrals=distance_integrals,
+                                batch_timestamps=timestamps)
+        for idx in range(max(first_idx, num_samples - self._recent_distance_integrals.maxlen), num_samples):
+            self._add_distance_integral_sample(
+                idx, distance_integrals[idx - first_idx].item(), timestamps[idx - first_idx].item()
+            )
+
+    def _add_distance_integral_sample(self, idx, distance_integral, timestamp):
+        self._recent_distance_integrals.append((idx, distance_integral, timestamp))
+        if idx == self._ongoing_stroke_first_speed_idx:
+            self._ongoing_stroke_start_distance_integral = distance_integral
+            self._ongoing_stroke_start_time = timestamp
+
+    def _get_distance_integral(self, idx, batch_first_idx=None, batch_distance_integrals=None,
+                               batch_timestamps=None):
+        if batch_first_idx is not None and idx >= batch_first_idx:
+            batch_idx = idx - batch_first_idx
+            return batch_distance_integrals[batch_idx].item(), batch_timestamps[batch_idx].item()
+        for sample_idx, distance_integral, timestamp in self._recent_distance_integrals:
+            if sample_idx == idx:
+                return distance_integral, timestamp
+        raise IndexError('Speed sample %d is no longer in the recent history.' % idx)
+
+    def _close_new_strokes(self, **batch):
+        strokes = self.workout.person.strokes
+        self._register_ongoing_stroke_start(**batch)
+        while self._num_strokes_with_boat_metrics < len(strokes):
+            stroke_idx = self._num_strokes_with_boat_metrics
+            end_idx = strokes.get_column('end_idx')[stroke_idx].item()
+            end_distance_integral, end_time = self._get_distance_integral(end_idx, **batch)
+            distance = end_distance_integral - self._ongoing_stroke_start_distance_integral
+            average_speed = distance / (end_time - self._ongoing_stroke_start_time)
+            strokes.set_values(
+                stroke_idx,
+                boat_distance=distance,
+                average_boat_speed=average_speed,
+                split_time=self.SPLIT_DISTANCE_METERS / average_speed,
+            )
+            self._num_strokes_with_boat_metrics += 1
+            # The next stroke starts on the acceleration sample right after this one ends.
+            self._ongoing_stroke_first_speed_idx = end_idx + 2
+            self._ongoing_stroke_start_distance_integral = None
+            self._ongoing_stroke_start_time = None
+            self._register_ongoing_stroke_start(**batch)
+
+    def _register_ongoing_stroke_start(self, **batch):
+        # The first sample of the ongoing stroke may have been integrated before we knew the stroke started there.
+        if self._ongoing_stroke_start_distance_integral is None and \
+                self._ongoing_stroke_first_speed_idx < self._num_integrated_speed_samples:
+            (self._ongoing_stroke_start_distance_integral,
+             self._ongoing_stroke_start_time) = self._get_distance_integral(
+                self._ongoing_stroke_first_speed_idx, **batch
+            )
+
+    def get_rolling_average_speed(self, window_duration=None, window_distance=None):
+        """Returns the average boat speed over the last window_duration seconds, or over the time it took to cover
+        the last window_distance meters (e.g. a rolling 500m average)."""
+        if window_duration is not None:
+            return self.speed.get_trailing_average_value(window_duration)
+        end_time = self.position.timestamps[-1]
+        window_start_position = self.position.values[-1] - window_distance
+        start_idx = self.position.search_values(window_start_position, side='left')
+        return self.speed.get_average_value(start_time=self.position.timestamps[start_idx], end_time=end_time)
+
 
 class RotatingWheel(BoatModel):
     """A simple model to calculate boat speed and distance traveled. We assume the "boat" is just a wheel moving on
@@ -35,3 +153,31 @@ class RotatingWheel(BoatModel):
                 value=boat_speed,
                 timestamp=self.workout.machine.flywheel_speed.timestamps[-1]
             )
+        self._update_stroke_metrics()
+
+    def process_batch(self, first_new_pulse_idx):
+        num_pulses = len(self.workout.machine.encoder_pulses)
+        if first_new_pulse_idx >= num_pulses:
+            return
+        position_increments = np.full(
+            num_pulses - first_new_pulse_idx, 1.0 / self.workout.machine.num_encoder_pulses_per_revolution
+        )
+        if len(self.position) == 0:
+            position_increments[0] = 0.0
+            previous_position = 0.0
+        else:
+            previous_position = self.position.values[-1]
+        # np.cumsum adds sequentially, so positions match the running sum computed by update().
+        positions = np.cumsum(np.concatenate(([previous_position], position_increments)))[1:]
+        self.position.extend(
+            values=positions,
+            timestamps=self.workout.machine.encoder_pulses[first_new_pulse_idx:].timestamps
+        )
+
+        # Every pulse that produces a flywheel speed sample also produces a boat speed sample.
+        new_flywheel_speed_samples_ts = self.workout.machine.flywheel_speed[len(self.speed):]
+        self.speed.extend(
+            values=new_flywheel_speed_samples_ts.values * self.WHEEL_CIRCUMFERENCE_METERS,
+            timestamps=new_flywheel_speed_samples_ts.timestamps
+        )
+        self._update_stroke_metrics_batch()
@@ -9,6 +9,8 @@ CONFIG_FILE_PATH = os.path.join(pathlib.Path(__file__).parent.absolute(), 'my_co
 
 DAMPING_MODEL_ESTIMATOR_CLASS_LOOKUP = {
     'magnetic': machine_metrics.LinearDampingFactorEstimator,
+    # Same damping model, refined on every recovery sample instead of once per stroke.
+    'magnetic_rls': machine_metrics.RecursiveLeastSquaresDampingEstimator,
 }
 
 Config = namedtuple(
@@ -21,7 +23,36 @@ Config = namedtuple(
         'machine_type',
         'flywheel_moment_of_inertia',
         'log_folder_path',
-        'damping_model_estimator_class'
+        'damping_model_estimator_class',
+        'hot_window_samples',
+        'spill_folder_path',
+        'machine_name',
+        'damper_setting',
+        'damping_model_cache_path',
+        'fit_damping_model_in_background',
+        'acquisition_queue_capacity',
+        'use_pigpio_notification_stream',
+        'run_acquisition_in_separate_process',
+        'ui_refresh_rate_hz',
+        'use_opengl_charts',
+        'enable_stage_timing',
+        'measure_pulse_latency',
+    ],
+    # Optional settings, so config files written before these were introduced keep working.
+    defaults=[
+        None,  # hot_window_samples
+        None,  # spill_folder_path
+        None,  # machine_name
+        None,  # damper_setting
+        None,  # damping_model_cache_path
+        False,  # fit_damping_model_in_background
+        None,  # acquisition_queue_capacity
+        False,  # use_pigpio_notification_stream
+        False,  # run_acquisition_in_separate_process
+        30,  # ui_refresh_rate_hz
+        False,  # use_opengl_charts
+        False,  # enable_stage_timing
+        False,  # measure_pulse_latency
     ])
 
 
@@ -0,0 +1,61 @@
+import json
+import os
+import time
+
+
+class DampingModelCache:
+    """Persists fitted damping model parameters across sessions, keyed by machine and damper setting, so a new
+    workout can start from the last model fitted on the same setup instead of assuming zero damping.
+
+    Entries that haven't been refreshed in MAX_AGE_DAYS are considered stale and ignored (the damping of a magnetic
+    rower drifts as magnets and bearings age), and only the MAX_ENTRIES most recently updated entries are kept."""
+    MAX_AGE_DAYS = 30
+    MAX_ENTRIES = 32
+
+    def __init__(self, file_path, max_age_days=MAX_AGE_DAYS, max_entries=MAX_ENTRIES):
+        self.file_path = file_path
+        self.max_age_days = max_age_days
+        self.max_entries = max_entries
+        self._entries = {}
+        if os.path.exists(file_path):
+            with open(file_path) as input_file:
+                try:
+                    self._entries = json.load(input_file)
+                except ValueError:
+                    # A corrupted cache is no worse than an empty one.
+                    self._entries = {}
+
+    @staticmethod
+    def make_key(machine_name, damper_setting):
+        return '%s/%s' % (machine_name, damper_setting)
+
+    def get(self, key):
+        """Returns the cached (intercept, slope) for this key, or None if there's no fresh entry."""
+        entry = self._entries.get(key)
+        if entry is None or self._is_stale(entry):
+            return None
+        return entry['intercept'], entry['slope']
+
+    def put(self, key, intercept, slope):
+        self._entries[key] = {
+            'intercept': float(intercept),
+            'slope': float(slope),
+            'updated': time.time(),
+        }
+        self._evict()
+
+    def save(self):
+        # Write to a temporary file first, so a crash mid-write can't leave a truncated cache behind.
+        temporary_file_path = self.file_path + '.tmp'
+        with open(temporary_file_path, 'w') as output_file:
+            json.dump(self._entries, output_file, indent=2, sort_keys=True)
+        os.replace(temporary_file_path, self.file_path)
+
+    def _is_stale(self, entry):
+        return time.time() - entry['updated'] > self.max_age_days * 24 * 60 * 60
+
+    def _evict(self):
+        self._entries = {key: entry for key, entry in self._entries.items() if not self._is_stale(entry)}
+        if len(self._entries) > self.max_entries:
+            most_recent_keys = sorted(self._entries, key=lambda k: self._entries[k]['updated'])[-self.max_entries:]
+            self._entries = {key: self._entries[key] for key in most_recent_keys}
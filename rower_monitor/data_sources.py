@@ -1,14 +1,28 @@
 import csv
+import math
+import numpy as np
 import pigpio
+import socket
+import struct
 import time
 import threading
 
+from .replay_scheduler import ReplayScheduler
+from .tick_queue import SpscRingBuffer, TickQueueWorker
+
 
 class DataSource:
     def __init__(self):
         pass
 
-    def start(self, sensor_pulse_event_handler_callback):
+    def start(self, sensor_pulse_event_handler_callback, sensor_pulse_batch_event_handler_callback=None):
+        """Starts calling sensor_pulse_event_handler_callback(timestamp, raw_ticks) for every sensor pulse. Data
+        sources that deliver pulses in batches call sensor_pulse_batch_event_handler_callback(timestamps,
+        raw_ticks) instead, if it's given.
+
+        Data sources that hand pulses over to another thread also pass the time each pulse arrived, on the
+        time.perf_counter() clock, as a third argument: arrival_time, or arrival_times for batches. Otherwise the
+        pulse is taken to arrive when the callback is called."""
         pass
 
     def stop(self):
@@ -24,6 +38,9 @@ class PiGpioClient(DataSource):
     # The reflective infrared sensor does not have hysteresis, so we need to filter out glitches in
     # software.
     GLITCH_FILTER_US = 1000
+    # Pulses wait in the acquisition queue along with the time they arrived, so the queueing delay counts towards
+    # the pulse latency.
+    ACQUISITION_QUEUE_DTYPE = np.dtype([('raw_ticks', np.int64), ('arrival_time', np.float64)])
 
     def __init__(
         self,
@@ -31,16 +48,30 @@ class PiGpioClient(DataSource):
         pigpio_port,
         gpio_pin_number,
         glitch_filter_us=GLITCH_FILTER_US,
+        acquisition_queue_capacity=None,
+        use_notification_stream=False,
     ):
         self.ip_address = ip_address
         self.pigpio_port = pigpio_port
         self.gpio_pin_number = gpio_pin_number
         self.glitch_filter_us = glitch_filter_us
+        # If set, the pigpio callback only queues the raw ticks, and a worker thread processes them in batches.
+        self.acquisition_queue_capacity = acquisition_queue_capacity
+        self.acquisition_queue = None
+        self._acquisition_worker = None
+        # If set, GPIO level reports are streamed from the pigpio daemon in bulk and decoded in batches, instead of
+        # getting one pigpio callback per pulse.
+        self.use_notification_stream = use_notification_stream
+        self._notification_stream = None
         self._first_raw_tick_value = None
         self._last_raw_tick_value = None
         self._num_rpi_counter_rollovers = 0
         self._pigpio_event_subscriber = None
         self._pigpio_connection = None
+        # Cancelling a pigpio callback doesn't wait for a call that's already running on pigpio's thread, so stop()
+        # takes this lock to make sure no pulse is being delivered, or will be, once it returns.
+        self._pigpio_callback_lock = threading.Lock()
+        self._delivering_pigpio_pulses = False
 
     def connect(self):
         if self._pigpio_connection is not None:
@@ -54,10 +85,19 @@ class PiGpioClient(DataSource):
     def _pigpio_callback(self, pin_num, level, raw_ticks):
         if pin_num != self.gpio_pin_number:
             return
+        arrival_time = time.perf_counter()
 
-        self.sensor_pulse_event_handler_callback(
-            self.get_timestamp_from_raw_ticks(raw_ticks), raw_ticks
-        )
+        with self._pigpio_callback_lock:
+            if not self._delivering_pigpio_pulses:
+                return
+
+            if self.acquisition_queue is not None:
+                self.acquisition_queue.push((raw_ticks, arrival_time))
+                return
+
+            self.sensor_pulse_event_handler_callback(
+                self.get_timestamp_from_raw_ticks(raw_ticks), raw_ticks, arrival_time
+            )
 
     def get_timestamp_from_raw_ticks(self, raw_ticks):
         if self._first_raw_tick_value is None:
@@ -83,12 +123,68 @@ class PiGpioClient(DataSource):
         # Convert the adjusted tick count to seconds since the first tick
         return adjusted_ticks * self.RPI_TICK_PERIOD_IN_SECONDS
 
-    def start(self, sensor_pulse_event_handler_callback):
+    def get_timestamps_from_raw_ticks(self, raw_ticks):
+        """Vectorized version of get_timestamp_from_raw_ticks for a batch of consecutive raw tick values. It returns
+        the same timestamps and leaves the rollover tracking in the same state as converting one tick at a time."""
+        raw_ticks = np.asarray(raw_ticks, dtype=np.int64)
+        if len(raw_ticks) == 0:
+            return np.empty(0, dtype=np.float64)
+        if self._first_raw_tick_value is None:
+            self._first_raw_tick_value = int(raw_ticks[0])
+        previous_raw_ticks = np.empty_like(raw_ticks)
+        previous_raw_ticks[0] = raw_ticks[0] if self._last_raw_tick_value is None else self._last_raw_tick_value
+        previous_raw_ticks[1:] = raw_ticks[:-1]
+        num_rpi_counter_rollovers = self._num_rpi_counter_rollovers + np.cumsum(raw_ticks < previous_raw_ticks)
+        self._num_rpi_counter_rollovers = int(num_rpi_counter_rollovers[-1])
+        self._last_raw_tick_value = int(raw_ticks[-1])
+
+        adjusted_ticks = (
+            raw_ticks
+            - self._first_raw_tick_value
+            + (self.RPI_TIMER_MAX_VALUE * num_rpi_counter_rollovers)
+        )
+        return adjusted_ticks * self.RPI_TICK_PERIOD_IN_SECONDS
+
+    def _process_queued_pulses(self, pulses):
+        self._process_raw_tick_batch(pulses['raw_ticks'], pulses['arrival_time'])
+
+    def _process_raw_tick_batch(self, raw_ticks, arrival_times):
+        if self.sensor_pulse_batch_event_handler_callback is not None:
+            self.sensor_pulse_batch_event_handler_callback(
+                self.get_timestamps_from_raw_ticks(raw_ticks), raw_ticks, arrival_times
+            )
+            return
+        for raw_tick_value, arrival_time in zip(raw_ticks.tolist(), arrival_times.tolist()):
+            self.sensor_pulse_event_handler_callback(
+                self.get_timestamp_from_raw_ticks(raw_tick_value), raw_tick_value, arrival_time
+            )
+
+    def start(self, sensor_pulse_event_handler_callback, sensor_pulse_batch_event_handler_callback=None):
         self.sensor_pulse_event_handler_callback = sensor_pulse_event_handler_callback
+        self.sensor_pulse_batch_event_handler_callback = sensor_pulse_batch_event_handler_callback
         self.connect()
+        if self.use_notification_stream:
+            self._notification_stream = PiGpioNotificationStream(
+                pigpio_connection=self._pigpio_connection,
+                ip_address=self.ip_address,
+                pigpio_port=self.pigpio_port,
+                gpio_pin_number=self.gpio_pin_number,
+                falling_edge_ticks_callback=self._process_raw_tick_batch
+            )
+            return
+        if self.acquisition_queue_capacity is not None:
+            self.acquisition_queue = SpscRingBuffer(
+                self.acquisition_queue_capacity,
+                dtype=self.ACQUISITION_QUEUE_DTYPE
+            )
+            self._acquisition_worker = TickQueueWorker(
+                ring_buffer=self.acquisition_queue,
+                batch_callback=self._process_queued_pulses
+            )
         # The infrared sensor output goes low when a flywheel hole passes in front of it. This will
         # configure the pigpio callback thread so it calls our function whenever there's a falling
         # edge on our pin.
+        self._delivering_pigpio_pulses = True
         self._pigpio_event_subscriber = self._pigpio_connection.callback(
             user_gpio=self.gpio_pin_number,
             edge=pigpio.FALLING_EDGE,
@@ -96,10 +192,20 @@ class PiGpioClient(DataSource):
         )
 
     def stop(self):
+        """Returns once no more pulses will be delivered."""
         if self._pigpio_event_subscriber is not None:
             self._pigpio_event_subscriber.cancel()
+        with self._pigpio_callback_lock:
+            self._delivering_pigpio_pulses = False
+        if self._notification_stream is not None:
+            self._notification_stream.stop()
+        if self._acquisition_worker is not None:
+            # Processes whatever is still queued before returning.
+            self._acquisition_worker.stop()
         if self._pigpio_connection is not None:
             self._pigpio_connection.stop()
+        self._acquisition_worker = None
+        self._notification_stream = None
         self._first_raw_tick_value = None
         self._last_raw_tick_value = None
         self._num_rpi_counter_rollovers = 0
@@ -107,11 +213,107 @@ class PiGpioClient(DataSource):
         self._pigpio_connection = None
 
 
+class PiGpioNotificationStream(threading.Thread):
+    """Reads GPIO level reports in bulk from a pigpio notification socket, and hands batches of the raw ticks of
+    falling edges on one pin to falling_edge_ticks_callback, along with the time.perf_counter() time the socket read
+    that brought them in returned.
+
+    This is the same mechanism pigpio.pi.callback uses under the hood, minus the per-report Python callback: reports
+    are decoded a whole socket read at a time with numpy."""
+    # Constants taken from https://github.com/joan2937/pigpio/blob/v76/pigpio.py
+    PI_CMD_BR1 = 10
+    PI_CMD_NOIB = 99
+    # Each report is: uint16 sequence number, uint16 flags, uint32 tick, uint32 levels of GPIO 0-31.
+    REPORT_DTYPE = np.dtype([('seqno', '<u2'), ('flags', '<u2'), ('tick', '<u4'), ('level', '<u4')])
+    RECEIVE_BUFFER_REPORTS = 1024
+
+    def __init__(self, pigpio_connection, ip_address, pigpio_port, gpio_pin_number, falling_edge_ticks_callback):
+        threading.Thread.__init__(self, daemon=True)
+        self.gpio_pin_number = gpio_pin_number
+        self.falling_edge_ticks_callback = falling_edge_ticks_callback
+        self._pigpio_connection = pigpio_connection
+        self._socket = socket.create_connection((ip_address, pigpio_port), None)
+        self._last_pin_level = (self._send_command(self.PI_CMD_BR1) >> gpio_pin_number) & 1
+        # Turns this socket into a notification stream, and tell the daemon which GPIO to report on.
+        self._handle = self._send_command(self.PI_CMD_NOIB)
+        if self._handle >= 1 << 31:
+            raise pigpio.error('Could not open a pigpio notification stream (error %d).' % (self._handle - (1 << 32)))
+        pigpio_connection.notify_begin(self._handle, 1 << gpio_pin_number)
+        self.go = True
+        self.start()
+
+    def _send_command(self, command, p1=0, p2=0):
+        self._socket.send(struct.pack('IIII', command, p1, p2, 0))
+        response = self._receive_exactly(16)
+        return struct.unpack('12sI', response)[1]
+
+    def _receive_exactly(self, num_bytes):
+        result = bytearray()
+        while len(result) < num_bytes:
+            chunk = self._socket.recv(num_bytes - len(result))
+            if not chunk:
+                raise pigpio.error('The pigpio daemon closed the connection.')
+            result += chunk
+        return bytes(result)
+
+    def run(self):
+        report_size = self.REPORT_DTYPE.itemsize
+        buffer = bytearray(self.RECEIVE_BUFFER_REPORTS * report_size)
+        num_buffered_bytes = 0
+        while self.go:
+            try:
+                num_received_bytes = self._socket.recv_into(memoryview(buffer)[num_buffered_bytes:])
+            except OSError:
+                break
+            arrival_time = time.perf_counter()
+            # Whatever arrives after stop() was called is dropped.
+            if num_received_bytes == 0 or not self.go:
+                break
+            num_buffered_bytes += num_received_bytes
+            num_reports = num_buffered_bytes // report_size
+            if num_reports == 0:
+                continue
+            raw_ticks = self.decode_falling_edge_ticks(buffer, num_reports)
+            # Keep the bytes of the last, partially received report for the next read.
+            num_leftover_bytes = num_buffered_bytes - num_reports * report_size
+            buffer[:num_leftover_bytes] = buffer[num_reports * report_size:num_buffered_bytes]
+            num_buffered_bytes = num_leftover_bytes
+            if len(raw_ticks) > 0:
+                self.falling_edge_ticks_callback(raw_ticks, np.full(len(raw_ticks), arrival_time))
+        self._socket.close()
+
+    def decode_falling_edge_ticks(self, report_bytes, num_reports):
+        """Returns the raw ticks of the falling edges on our pin among the first num_reports reports."""
+        reports = np.frombuffer(report_bytes, dtype=self.REPORT_DTYPE, count=num_reports)
+        # Reports with flags set are watchdog timeouts, events or keep-alives, not level changes.
+        reports = reports[reports['flags'] == 0]
+        if len(reports) == 0:
+            return np.empty(0, dtype=np.int64)
+        pin_levels = (reports['level'] >> self.gpio_pin_number) & 1
+        previous_pin_levels = np.empty_like(pin_levels)
+        previous_pin_levels[0] = self._last_pin_level
+        previous_pin_levels[1:] = pin_levels[:-1]
+        self._last_pin_level = int(pin_levels[-1])
+        falling_edges = (previous_pin_levels == 1) & (pin_levels == 0)
+        return reports['tick'][falling_edges].astype(np.int64)
+
+    def stop(self):
+        if self.go:
+            self.go = False
+            # The close command goes over the command connection: its reply there would otherwise land in the
+            # notification stream and be decoded as a report. The daemon then closes the stream, which ends the read
+            # loop.
+            self._pigpio_connection.notify_close(self._handle)
+            self.join()
+
+
 # Provides data from a pre-recorded workout. Useful for development and debugging.
 class CsvFile(PiGpioClient):
+    """With sample_delay set, pulses are delivered at their recorded times divided by replay_speed (e.g. 0.5, 1 or
+    10), like they happened on the machine. Otherwise they're delivered as fast as possible. Either way,
+    get_replay_statistics() tells how well the replay kept up."""
     DUMMY_VALUE = 0
     RAW_TICKS_COLUMN_NAME = 'ticks'
-    SAMPLE_DELAY_SECONDS = 0.016
 
     def __init__(
         self,
@@ -119,6 +321,7 @@ class CsvFile(PiGpioClient):
         raw_ticks_column_name=RAW_TICKS_COLUMN_NAME,
         sample_delay=False,
         threaded=True,
+        replay_speed=1.0,
     ):
         self.ticks_csv_file_path = ticks_csv_file_path
         self.raw_ticks_column_name = raw_ticks_column_name
@@ -127,9 +330,12 @@ class CsvFile(PiGpioClient):
         self._num_rpi_counter_rollovers = 0
         self.sample_delay = sample_delay
         self.threaded = threaded
+        self.replay_speed = replay_speed
+        self.replay_scheduler = None
         self._reader_thread = None
 
-    def start(self, sensor_pulse_event_handler_callback):
+    def start(self, sensor_pulse_event_handler_callback, sensor_pulse_batch_event_handler_callback=None):
+        self.replay_scheduler = ReplayScheduler(speed_multiplier=self.replay_speed if self.sample_delay else None)
         if self.threaded:
             self._reader_thread = CsvReaderThread(
                 sensor_pulse_event_handler_callback=sensor_pulse_event_handler_callback,
@@ -142,16 +348,32 @@ class CsvFile(PiGpioClient):
                     raw_ticks = int(row[self.raw_ticks_column_name])
                     if raw_ticks == self.DUMMY_VALUE:
                         continue
-                    sensor_pulse_event_handler_callback(
-                        self.get_timestamp_from_raw_ticks(raw_ticks),
-                        raw_ticks
-                    )
-                    if self.sample_delay:
-                        time.sleep(self.SAMPLE_DELAY_SECONDS)
+                    sensor_pulse_time = self.get_timestamp_from_raw_ticks(raw_ticks)
+                    if not self.replay_scheduler.wait_until_due(sensor_pulse_time):
+                        break
+                    sensor_pulse_event_handler_callback(sensor_pulse_time, raw_ticks)
 
     def stop(self):
+        """Returns once no more pulses will be delivered."""
+        if self.replay_scheduler is not None:
+            self.replay_scheduler.cancel()
         if self._reader_thread is not None:
             self._reader_thread.stop()
+            self._reader_thread = None
+
+    def get_replay_statistics(self):
+        """Returns the lateness and drift of the replay, in seconds, and the speed multiplier it actually achieved.
+        See ReplayScheduler.get_statistics."""
+        if self.replay_scheduler is None:
+            return {'num_pulses': 0}
+        return self.replay_scheduler.get_statistics()
+
+    def read_raw_ticks(self):
+        """Returns all the raw tick values in the file as an array, e.g. to feed WorkoutMetricsTracker.process_batch."""
+        with open(self.ticks_csv_file_path) as input_file:
+            csv_reader = csv.DictReader(input_file)
+            raw_ticks = np.array([int(row[self.raw_ticks_column_name]) for row in csv_reader], dtype=np.int64)
+        return raw_ticks[raw_ticks != self.DUMMY_VALUE]
 
 
 class CsvReaderThread(threading.Thread):
@@ -165,18 +387,217 @@ class CsvReaderThread(threading.Thread):
         self.start()
 
     def run(self):
-        for row in self.csv_reader:
-            if not self.go:
-                break
-            raw_ticks = int(row[self.parent.raw_ticks_column_name])
-            if raw_ticks == self.parent.DUMMY_VALUE:
-                continue
-            self.sensor_pulse_event_handler_callback(
-                self.parent.get_timestamp_from_raw_ticks(raw_ticks),
-                raw_ticks
+        with self.input_file:
+            for row in self.csv_reader:
+                if not self.go:
+                    break
+                raw_ticks = int(row[self.parent.raw_ticks_column_name])
+                if raw_ticks == self.parent.DUMMY_VALUE:
+                    continue
+                sensor_pulse_time = self.parent.get_timestamp_from_raw_ticks(raw_ticks)
+                # Waiting can take long at low replay speeds, and the replay may have been stopped in the meantime.
+                if not self.parent.replay_scheduler.wait_until_due(sensor_pulse_time) or not self.go:
+                    break
+                self.sensor_pulse_event_handler_callback(sensor_pulse_time, raw_ticks)
+
+    def stop(self):
+        self.go = False
+        self.parent.replay_scheduler.cancel()
+        if self.is_alive() and threading.current_thread() is not self:
+            self.join()
+
+
+class SimulatedRower(PiGpioClient):
+    """Simulates a rowing machine flywheel and the athlete driving it, for load testing at pulse rates and session
+    lengths that the recordings don't cover.
+
+    The flywheel has a moment of inertia and a damping torque of linear_damping_coefficient * speed +
+    quadratic_damping_coefficient * speed ** 2 (a magnetic brake is mostly linear, an air fan mostly quadratic). The
+    athlete applies a half-sine torque during the drive of every stroke. The peak torque is adjusted after each stroke
+    so the average power converges to average_power_watts. Stroke duration and strength vary randomly from stroke to
+    stroke, with a relative standard deviation of stroke_variability.
+
+    The raw ticks are what the Raspberry Pi would report with num_encoder_pulses_per_revolution holes in the
+    flywheel, including the 32-bit counter rollover, which the default first_raw_tick_value makes happen 10 seconds
+    in. With real_time set, pulses are delivered one at a time at the pace they would happen on the machine.
+    Otherwise they're delivered as fast as possible, one stroke at a time to the batch callback if there is one. The
+    simulation stops after duration_seconds, or when stop() is called if that's None."""
+    TIME_STEP_SECONDS = 1e-3
+
+    def __init__(
+        self,
+        flywheel_moment_of_inertia=0.1,
+        linear_damping_coefficient=0.03,
+        quadratic_damping_coefficient=0.0001,
+        num_encoder_pulses_per_revolution=4,
+        strokes_per_minute=24,
+        average_power_watts=150.0,
+        drive_to_recovery_ratio=0.5,
+        stroke_variability=0.03,
+        duration_seconds=None,
+        real_time=True,
+        threaded=True,
+        first_raw_tick_value=PiGpioClient.RPI_TIMER_MAX_VALUE - 10 * 1000000,
+        random_seed=None,
+    ):
+        self.flywheel_moment_of_inertia = flywheel_moment_of_inertia
+        self.linear_damping_coefficient = linear_damping_coefficient
+        self.quadratic_damping_coefficient = quadratic_damping_coefficient
+        self.num_encoder_pulses_per_revolution = num_encoder_pulses_per_revolution
+        self.strokes_per_minute = strokes_per_minute
+        self.average_power_watts = average_power_watts
+        self.drive_to_recovery_ratio = drive_to_recovery_ratio
+        self.stroke_variability = stroke_variability
+        self.duration_seconds = duration_seconds
+        self.real_time = real_time
+        self.threaded = threaded
+        self.first_simulated_raw_tick_value = first_raw_tick_value
+        self.random_seed = random_seed
+        self.replay_scheduler = None
+        self._first_raw_tick_value = None
+        self._last_raw_tick_value = None
+        self._num_rpi_counter_rollovers = 0
+        self._simulator_thread = None
+
+    def simulate_strokes(self, duration_seconds=None):
+        """Yields the pulse times of each simulated stroke, in seconds since the start of the session, as arrays."""
+        random_generator = np.random.default_rng(self.random_seed)
+        inertia = self.flywheel_moment_of_inertia
+        linear_damping = self.linear_damping_coefficient
+        quadratic_damping = self.quadratic_damping_coefficient
+        pulses_per_radian = self.num_encoder_pulses_per_revolution / (2 * math.pi)
+        time_step = self.TIME_STEP_SECONDS
+        nominal_stroke_duration = 60.0 / self.strokes_per_minute
+        drive_fraction = self.drive_to_recovery_ratio / (1 + self.drive_to_recovery_ratio)
+        # Initial guess for the peak torque: the steady-state speed at which the damping dissipates the target power,
+        # and the half-sine torque that delivers that power on average at that speed.
+        steady_state_speed = max(
+            root.real for root in np.roots([quadratic_damping, linear_damping, 0.0, -self.average_power_watts])
+            if abs(root.imag) < 1e-9
+        )
+        peak_torque = self.average_power_watts / steady_state_speed / drive_fraction * math.pi / 2
+
+        stroke_start_time = 0.0
+        speed = 0.0
+        # Flywheel angle measured in encoder pulses, so a pulse happens every time it crosses an integer.
+        pulse_angle = 0.0
+        while duration_seconds is None or stroke_start_time < duration_seconds:
+            stroke_duration = nominal_stroke_duration * (
+                1 + self.stroke_variability * random_generator.standard_normal()
             )
-            if self.parent.sample_delay:
-                time.sleep(self.parent.SAMPLE_DELAY_SECONDS)
+            num_drive_steps = int(round(stroke_duration * drive_fraction / time_step))
+            num_steps = int(round(stroke_duration / time_step))
+            # The handle torque at the start, middle and end of each time step of the drive.
+            stroke_peak_torque = peak_torque * (1 + self.stroke_variability * random_generator.standard_normal())
+            handle_torques = (stroke_peak_torque * np.sin(
+                np.pi * np.arange(2 * num_drive_steps + 1) / (2 * num_drive_steps)
+            )).tolist() + [0.0, 0.0, 0.0]
+            pulse_times = []
+            work = 0.0
+            for step_idx in range(num_steps):
+                torque_idx = min(2 * step_idx, 2 * num_drive_steps + 1)
+                start_torque, mid_torque, end_torque = handle_torques[torque_idx:torque_idx + 3]
+                # One Runge-Kutta step for the flywheel speed.
+                speed_1 = speed
+                acceleration_1 = (start_torque - (linear_damping + quadratic_damping * speed_1) * speed_1) / inertia
+                speed_2 = speed + acceleration_1 * time_step / 2
+                acceleration_2 = (mid_torque - (linear_damping + quadratic_damping * speed_2) * speed_2) / inertia
+                speed_3 = speed + acceleration_2 * time_step / 2
+                acceleration_3 = (mid_torque - (linear_damping + quadratic_damping * speed_3) * speed_3) / inertia
+                speed_4 = speed + acceleration_3 * time_step
+                acceleration_4 = (end_torque - (linear_damping + quadratic_damping * speed_4) * speed_4) / inertia
+                new_speed = speed + (acceleration_1 + 2 * acceleration_2 + 2 * acceleration_3 + acceleration_4) * \
+                    time_step / 6
+                if new_speed < 0.0:
+                    new_speed = 0.0
+                average_speed = (speed + new_speed) / 2
+                new_pulse_angle = pulse_angle + average_speed * time_step * pulses_per_radian
+                work += mid_torque * average_speed * time_step
+                # Pulses within this step happen at linearly interpolated times.
+                next_pulse = math.floor(pulse_angle) + 1
+                while next_pulse <= new_pulse_angle:
+                    pulse_times.append(
+                        stroke_start_time + (step_idx + (next_pulse - pulse_angle) / (new_pulse_angle - pulse_angle))
+                        * time_step
+                    )
+                    next_pulse += 1
+                speed = new_speed
+                pulse_angle = new_pulse_angle
+            stroke_duration = num_steps * time_step
+            stroke_start_time += stroke_duration
+            average_power = work / stroke_duration
+            if average_power > 0:
+                # Delivered power grows faster than linearly with torque, so correct gently to avoid overshooting.
+                peak_torque *= math.sqrt(self.average_power_watts / average_power)
+            pulse_times = np.array(pulse_times)
+            if duration_seconds is not None:
+                pulse_times = pulse_times[pulse_times <= duration_seconds]
+            yield pulse_times
+
+    def get_raw_ticks_from_pulse_times(self, pulse_times):
+        """Returns the raw tick values the Raspberry Pi would report for pulses at these times since the start."""
+        raw_ticks = self.first_simulated_raw_tick_value + np.round(
+            np.asarray(pulse_times) / self.RPI_TICK_PERIOD_IN_SECONDS
+        ).astype(np.int64)
+        return raw_ticks % self.RPI_TIMER_MAX_VALUE
+
+    def simulate_raw_ticks(self, duration_seconds):
+        """Returns all the raw tick values of a simulated session at once, e.g. to feed
+        WorkoutMetricsTracker.process_batch."""
+        pulse_times = np.concatenate(list(self.simulate_strokes(duration_seconds)))
+        return self.get_raw_ticks_from_pulse_times(pulse_times)
+
+    def start(self, sensor_pulse_event_handler_callback, sensor_pulse_batch_event_handler_callback=None):
+        self.replay_scheduler = ReplayScheduler(speed_multiplier=1.0)
+        self._simulator_thread = SimulatedRowerThread(
+            sensor_pulse_event_handler_callback=sensor_pulse_event_handler_callback,
+            sensor_pulse_batch_event_handler_callback=sensor_pulse_batch_event_handler_callback,
+            parent=self
+        )
+        if self.threaded:
+            self._simulator_thread.start()
+        else:
+            self._simulator_thread.run()
+
+    def stop(self):
+        if self._simulator_thread is not None:
+            self._simulator_thread.stop()
+        self._simulator_thread = None
+
+
+class SimulatedRowerThread(threading.Thread):
+    def __init__(self, sensor_pulse_event_handler_callback, sensor_pulse_batch_event_handler_callback, parent):
+        threading.Thread.__init__(self, daemon=True)
+        self.parent = parent
+        self.sensor_pulse_event_handler_callback = sensor_pulse_event_handler_callback
+        self.sensor_pulse_batch_event_handler_callback = sensor_pulse_batch_event_handler_callback
+        self.go = True
+
+    def run(self):
+        for pulse_times in self.parent.simulate_strokes(self.parent.duration_seconds):
+            if not self.go:
+                return
+            raw_ticks = self.parent.get_raw_ticks_from_pulse_times(pulse_times)
+            if self.parent.real_time:
+                for pulse_time, raw_tick_value in zip(pulse_times.tolist(), raw_ticks.tolist()):
+                    if not self.parent.replay_scheduler.wait_until_due(pulse_time) or not self.go:
+                        return
+                    self.sensor_pulse_event_handler_callback(
+                        self.parent.get_timestamp_from_raw_ticks(raw_tick_value), raw_tick_value
+                    )
+            elif self.sensor_pulse_batch_event_handler_callback is not None:
+                if len(raw_ticks) > 0:
+                    self.sensor_pulse_batch_event_handler_callback(
+                        self.parent.get_timestamps_from_raw_ticks(raw_ticks), raw_ticks
+                    )
+            else:
+                for raw_tick_value in raw_ticks.tolist():
+                    self.sensor_pulse_event_handler_callback(
+                        self.parent.get_timestamp_from_raw_ticks(raw_tick_value), raw_tick_value
+                    )
 
     def stop(self):
         self.go = False
+        self.parent.replay_scheduler.cancel()
+        if self.is_alive() and threading.current_thread() is not self:
+            self.join()
@@ -0,0 +1,41 @@
+import numpy as np
+
+
+class AppendOnlyChunkStore:
+    """An append-only binary file of fixed-width float64 records. Records are written in chunks and read back
+    through a read-only memory map, so random access to old records doesn't load the whole file into RAM."""
+
+    def __init__(self, file_path, num_columns):
+        self.file_path = file_path
+        self.num_columns = num_columns
+        self._file = open(file_path, 'wb')
+        self._num_records = 0
+        self._records = None
+
+    def append(self, records):
+        records = np.ascontiguousarray(records, dtype=np.float64).reshape(-1, self.num_columns)
+        self._file.write(records.tobytes())
+        self._file.flush()
+        self._num_records += len(records)
+        # The file grew, so the current memory map is stale.
+        self._records = None
+
+    def get_records(self):
+        """Returns a read-only (num_records, num_columns) array backed by the file."""
+        if self._records is None:
+            if self._num_records == 0:
+                return np.empty((0, self.num_columns), dtype=np.float64)
+            self._records = np.memmap(
+                self.file_path,
+                dtype=np.float64,
+                mode='r',
+                shape=(self._num_records, self.num_columns)
+            )
+        return self._records
+
+    def close(self):
+        self._records = None
+        self._file.close()
+
+    def __len__(self):
+        return self._num_records
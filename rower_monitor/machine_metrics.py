@@ -1,5 +1,6 @@
+import concurrent.futures
+
 import numpy as np
-from sklearn.linear_model import LinearRegression
 
 from .time_series import TimeSeries
 
@@ -9,21 +10,43 @@ class MachineMetricsTracker:
                  workout,
                  flywheel_moment_of_inertia,
                  damping_model_estimator_class,
-                 num_encoder_pulses_per_revolution):
+                 num_encoder_pulses_per_revolution,
+                 fit_damping_model_in_background=False):
         self.workout = workout
         self.num_encoder_pulses_per_revolution = num_encoder_pulses_per_revolution
         self.flywheel_moment_of_inertia = flywheel_moment_of_inertia
 
-        self.raw_ticks = []
-        self.encoder_pulse_timestamps = []
-        self.flywheel_speed = TimeSeries()
-        self.flywheel_acceleration = TimeSeries()
+        # Raw tick values of the encoder pulses, timestamped with seconds since the start of the workout.
+        self.encoder_pulses = workout.new_time_series('encoder_pulses')
+        self.flywheel_speed = workout.new_time_series('flywheel_speed')
+        self.flywheel_acceleration = workout.new_time_series('flywheel_acceleration')
 
         self.damping_model_estimator = damping_model_estimator_class(workout)
+        # One fitted model per stroke, plus the model currently used to estimate the damping torque. The latter is
+        # the last per-stroke model, unless the estimator refines its model on every sample.
         self.damping_models = []
-        self.damping_torque = TimeSeries()
+        self.damping_model = None
+        # When enabled, per-stroke damping model fits run on a worker thread instead of delaying the pulse that
+        # closes the stroke. The current model keeps being used until the new one is published.
+        self.fit_damping_model_in_background = fit_damping_model_in_background
+        self._damping_model_fit_executor = None
+        self._damping_model_fit_futures = []
+        self.damping_torque = workout.new_time_series('damping_torque')
         self.strokes_seen = 0
 
+    def warm_start_damping_model(self, intercept, slope):
+        """Starts from a previously fitted damping model (e.g. cached from an earlier session on this machine)
+        instead of assuming zero damping until the first stroke is complete."""
+        self.damping_model = self.damping_model_estimator.warm_start(intercept=intercept, slope=slope)
+
+    @property
+    def raw_ticks(self):
+        return self.encoder_pulses.values
+
+    @property
+    def encoder_pulse_timestamps(self):
+        return self.encoder_pulses.timestamps
+
     def update(self, sensor_pulse_time, raw_tick_value):
         self.update_flywheel_metrics(
             sensor_pulse_time=sensor_pulse_time,
@@ -32,33 +55,133 @@ class MachineMetricsTracker:
         # There's a bit of a chicken-and-egg problem here between MachineMetricsTracker.update_damping_metrics (which
         # requires at least one stroke to be available) and PersonMetricsTracker.update (which requires at least one
         # damping torque sample. Both components will assume the damping torque is zero during the first stroke,
-        # as a trade-off between accuracy and responsiveness.
+        # as a trade-off between accuracy and responsiveness. (Online estimators such as
+        # RecursiveLeastSquaresDampingEstimator don't have this problem.)
         self.update_damping_metrics()
 
     def update_flywheel_metrics(self, sensor_pulse_time, raw_tick_value):
-        self.raw_ticks.append(raw_tick_value)
-        self.encoder_pulse_timestamps.append(sensor_pulse_time)
+        self.encoder_pulses.append(value=raw_tick_value, timestamp=sensor_pulse_time)
         self._update_speed_time_series()
         self._update_acceleration_time_series()
 
     def update_damping_metrics(self):
+        self._fit_damping_models_to_new_strokes()
+        if len(self.flywheel_acceleration) > 0:
+            self._update_damping_model_online(acceleration_idx=len(self.flywheel_acceleration) - 1)
+        self._update_damping_torque_time_series()
+
+    def update_flywheel_metrics_batch(self, sensor_pulse_times, raw_tick_values):
+        """Vectorized equivalent of calling update_flywheel_metrics once per pulse, with bit-identical results."""
+        first_new_pulse_idx = len(self.encoder_pulses)
+        self.encoder_pulses.extend(values=raw_tick_values, timestamps=sensor_pulse_times)
+        self._update_speed_time_series_batch(first_new_pulse_idx)
+        self._update_acceleration_time_series_batch()
+
+    def update_damping_metrics_batch(self, end_idx, synchronous=False):
+        """Vectorized equivalent of calling update_damping_metrics once per acceleration sample, up to (but not
+        including) acceleration sample end_idx. The damping model can only change at stroke boundaries, so batches
+        must not span a new stroke; PersonMetricsTracker.process_batch takes care of that. With synchronous=True,
+        fits run on this thread even if fit_damping_model_in_background is set, so offline results don't depend on
+        thread scheduling."""
+        self._fit_damping_models_to_new_strokes(synchronous=synchronous)
+        start_idx = len(self.damping_torque)
+        if end_idx <= start_idx:
+            return
+        if self.damping_model_estimator.UPDATES_PER_SAMPLE:
+            # Online estimators refine the model on every sample, so the model isn't constant within the batch.
+            for acceleration_idx in range(start_idx, end_idx):
+                self._update_damping_model_online(acceleration_idx=acceleration_idx)
+                self._append_damping_torque_sample(acceleration_idx=acceleration_idx)
+            return
+        timestamps = self.flywheel_acceleration[start_idx:end_idx].timestamps
+        if self.damping_model is None:
+            damping_torque = np.zeros(end_idx - start_idx)
+        else:
+            # Speed has 1 extra sample at the beginning, so acceleration sample i sits between speed samples i and
+            # i + 1.
+            speed_values = self.flywheel_speed[start_idx:end_idx + 1].values
+            speed_values = (speed_values[1:] + speed_values[:-1]) / 2.0
+            damping_acceleration = self.damping_model.single_point(speed_value=speed_values)
+            damping_torque = damping_acceleration * self.flywheel_moment_of_inertia
+        self.damping_torque.extend(values=damping_torque, timestamps=timestamps)
+
+    def finish_pending_damping_model_fits(self):
+        """Blocks until all background damping model fits have been published, then re-raises the exception of the
+        first fit that failed, if any."""
+        if self._damping_model_fit_executor is not None:
+            self._damping_model_fit_executor.shutdown(wait=True)
+            self._damping_model_fit_executor = None
+        futures, self._damping_model_fit_futures = self._damping_model_fit_futures, []
+        for future in futures:
+            future.result()
+
+    def _fit_damping_models_to_new_strokes(self, synchronous=False):
         new_stroke_info_available = len(self.workout.person.strokes) > self.strokes_seen
-        if new_stroke_info_available:
-            self.damping_models.append(
-                self.damping_model_estimator.fit_model_to_stroke_recovery_data(
-                    stroke=self.workout.person.strokes.values[-1]
+        if not new_stroke_info_available:
+            return
+        self.strokes_seen += 1
+        # Gathering the recovery data is cheap; it has to happen here, while the stroke's samples are guaranteed to
+        # be in the hot window.
+        recovery_data = self.damping_model_estimator.get_stroke_recovery_data(
+            stroke=self.workout.person.strokes.values[-1]
+        )
+        if self.fit_damping_model_in_background and not synchronous:
+            if self._damping_model_fit_executor is None:
+                # A single worker publishes models in stroke order.
+                self._damping_model_fit_executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=1,
+                    thread_name_prefix='damping_model_fit'
                 )
+            # Fits that succeeded can be forgotten; failed ones are kept so finish_pending_damping_model_fits can
+            # report them.
+            self._damping_model_fit_futures = [
+                future for future in self._damping_model_fit_futures
+                if not future.done() or future.exception() is not None
+            ]
+            self._damping_model_fit_futures.append(
+                self._damping_model_fit_executor.submit(self._fit_and_publish_damping_model, recovery_data)
             )
-            self.strokes_seen += 1
-        self._update_damping_torque_time_series()
+        else:
+            self._fit_and_publish_damping_model(recovery_data)
+
+    def _fit_and_publish_damping_model(self, recovery_data):
+        damping_model = self.damping_model_estimator.fit_model_to_recovery_data(recovery_data)
+        # Publishing is a list append plus a reference assignment. Both are atomic, so the pulse-handling thread
+        # sees either the previous model or the new one, never a half-updated one.
+        self.damping_models.append(damping_model)
+        # Online estimators publish their live model in update(); the per-stroke model is just a snapshot.
+        if not self.damping_model_estimator.UPDATES_PER_SAMPLE:
+            self.damping_model = damping_model
+
+    def _update_damping_model_online(self, acceleration_idx):
+        updated_damping_model = self.damping_model_estimator.update(acceleration_idx=acceleration_idx)
+        if updated_damping_model is not None:
+            self.damping_model = updated_damping_model
 
     def _update_speed_time_series(self):
         # Have we seen at least one full revolution?
-        if len(self.encoder_pulse_timestamps) < self.num_encoder_pulses_per_revolution + 1:
+        if len(self.encoder_pulses) < self.num_encoder_pulses_per_revolution + 1:
             return
         speed_data_point, data_point_timestamp = self._get_speed_data_point_estimate()
         self.flywheel_speed.append(speed_data_point, data_point_timestamp)
 
+    def _update_speed_time_series_batch(self, first_new_pulse_idx):
+        num_pulses = len(self.encoder_pulses)
+        first_speed_pulse_idx = max(first_new_pulse_idx, self.num_encoder_pulses_per_revolution)
+        if first_speed_pulse_idx >= num_pulses:
+            return
+        # Same computation as _get_speed_data_point_estimate, for every new pulse that completes a revolution.
+        pulse_timestamps = self.encoder_pulses[
+            first_speed_pulse_idx - self.num_encoder_pulses_per_revolution: num_pulses
+        ].timestamps
+        start_of_revolution_timestamps = pulse_timestamps[:-self.num_encoder_pulses_per_revolution]
+        end_of_revolution_timestamps = pulse_timestamps[self.num_encoder_pulses_per_revolution:]
+        revolution_times = end_of_revolution_timestamps - start_of_revolution_timestamps
+        self.flywheel_speed.extend(
+            values=1.0 / revolution_times,
+            timestamps=(revolution_times / 2.0) + start_of_revolution_timestamps,
+        )
+
     def _get_speed_data_point_estimate(self):
         # Account for the fact that the holes in the flywheel aren't perfectly aligned. We compute
         # speed by measuring the time between sensor pulses caused by the same hole. The unit of
@@ -88,6 +211,20 @@ class MachineMetricsTracker:
             timestamp=data_point_timestamp,
         )
 
+    def _update_acceleration_time_series_batch(self):
+        # There's one acceleration sample for every speed sample, except the first one.
+        first_new_speed_idx = max(len(self.flywheel_acceleration) + 1, 1)
+        if first_new_speed_idx >= len(self.flywheel_speed):
+            return
+        # Same computation as _get_acceleration_data_point_estimate, for every new speed sample.
+        speed_samples_ts = self.flywheel_speed[first_new_speed_idx - 1:]
+        speed_deltas = np.diff(speed_samples_ts.values)
+        time_deltas = np.diff(speed_samples_ts.timestamps)
+        self.flywheel_acceleration.extend(
+            values=speed_deltas / time_deltas,
+            timestamps=(time_deltas / 2) + speed_samples_ts.timestamps[:-1],
+        )
+
     def _get_acceleration_data_point_estimate(self):
         speed_now_value, speed_now_timestamp = self.flywheel_speed[-1]
         previous_speed_value, previous_speed_timestamp = self.flywheel_speed[-2]
@@ -105,20 +242,80 @@ class MachineMetricsTracker:
     def _update_damping_torque_time_series(self):
         if len(self.flywheel_speed) < 2:
             return
+        self._append_damping_torque_sample(acceleration_idx=len(self.flywheel_acceleration) - 1)
+
+    def _append_damping_torque_sample(self, acceleration_idx):
         # If we don't have a fitted model yet, assume the torque is zero
-        if len(self.damping_models) < 1:
+        if self.damping_model is None:
             damping_torque = 0.0
         else:
-            speed_value = (self.flywheel_speed.values[-1] + self.flywheel_speed.values[-2]) / 2.0
-            damping_acceleration = self.damping_models[-1].single_point(speed_value=speed_value)
+            # Acceleration sample i sits between speed samples i and i + 1.
+            speed_value = (self.flywheel_speed.values[acceleration_idx + 1] +
+                           self.flywheel_speed.values[acceleration_idx]) / 2.0
+            damping_acceleration = self.damping_model.single_point(speed_value=speed_value)
             damping_torque = damping_acceleration * self.flywheel_moment_of_inertia
         self.damping_torque.append(
             value=damping_torque,
-            timestamp=self.flywheel_acceleration.timestamps[-1]
+            timestamp=self.flywheel_acceleration.timestamps[acceleration_idx]
         )
 
 
+class LinearLeastSquaresAccumulator:
+    """Ordinary least squares fit of y = intercept + slope * x, computed in closed form from the running means of x
+    and y and their co-moments (sums of products of deviations from the means). Samples can be added one at a time
+    (Welford's update) or in batches (merged with Chan's formula). Flywheel speeds are large and close together, so
+    raw sums of x^2 and x*y would lose most of their precision to cancellation over a long session."""
+    __slots__ = ('num_samples', 'mean_x', 'mean_y', 'm2_x', 'c_xy')
+
+    def __init__(self):
+        self.num_samples = 0
+        self.mean_x = 0.0
+        self.mean_y = 0.0
+        # Sum of (x - mean_x)^2 and of (x - mean_x) * (y - mean_y) over the samples so far.
+        self.m2_x = 0.0
+        self.c_xy = 0.0
+
+    def add_sample(self, x, y):
+        self.num_samples += 1
+        delta_x = x - self.mean_x
+        self.mean_x += delta_x / self.num_samples
+        self.mean_y += (y - self.mean_y) / self.num_samples
+        self.m2_x += delta_x * (x - self.mean_x)
+        self.c_xy += delta_x * (y - self.mean_y)
+
+    def add_samples(self, x, y):
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        if len(x) == 0:
+            return
+        batch_num_samples = len(x)
+        batch_mean_x = float(np.mean(x))
+        batch_mean_y = float(np.mean(y))
+        batch_deviations_x = x - batch_mean_x
+        batch_m2_x = float(np.dot(batch_deviations_x, batch_deviations_x))
+        batch_c_xy = float(np.dot(batch_deviations_x, y - batch_mean_y))
+        num_samples = self.num_samples + batch_num_samples
+        delta_x = batch_mean_x - self.mean_x
+        delta_y = batch_mean_y - self.mean_y
+        weight = self.num_samples * batch_num_samples / num_samples
+        self.m2_x += batch_m2_x + delta_x * delta_x * weight
+        self.c_xy += batch_c_xy + delta_x * delta_y * weight
+        self.mean_x += delta_x * batch_num_samples / num_samples
+        self.mean_y += delta_y * batch_num_samples / num_samples
+        self.num_samples = num_samples
+
+    def get_fit(self):
+        """Returns (intercept, slope), or None if the samples don't determine a line (e.g. all x are equal)."""
+        if self.num_samples < 2 or self.m2_x <= 0.0:
+            return None
+        slope = self.c_xy / self.m2_x
+        intercept = self.mean_y - slope * self.mean_x
+        return intercept, slope
+
+
 class LinearDampingFactorEstimator:
+    # This estimator fits a new model once per stroke, in fit_model_to_stroke_recovery_data.
+    UPDATES_PER_SAMPLE = False
 
     class FittedLinearDampingFactorModel:
         def __init__(self, intercept, slope):
@@ -132,7 +329,21 @@ class LinearDampingFactorEstimator:
     def __init__(self, workout):
         self.workout = workout
 
+    def update(self, acceleration_idx):
+        """Called once per new flywheel acceleration sample. Online estimators return their refined model here;
+        this one returns None, meaning the current model doesn't change."""
+        return None
+
+    def warm_start(self, intercept, slope):
+        """Returns the model to use until the first stroke is fitted. New strokes replace it as usual."""
+        return self.FittedLinearDampingFactorModel(intercept=intercept, slope=slope)
+
     def fit_model_to_stroke_recovery_data(self, stroke):
+        return self.fit_model_to_recovery_data(self.get_stroke_recovery_data(stroke))
+
+    def get_stroke_recovery_data(self, stroke):
+        """Returns the samples that fit_model_to_recovery_data needs for this stroke. Slices of past samples never
+        change after the fact, so the fit itself can safely run on another thread."""
         acceleration_samples_ts = self.workout.machine.flywheel_acceleration[
             stroke.start_of_recovery_idx: stroke.end_of_recovery_idx + 1
         ]
@@ -141,39 +352,49 @@ class LinearDampingFactorEstimator:
         speed_samples_ts = self.workout.machine.flywheel_speed[
             stroke.start_of_recovery_idx: stroke.end_of_recovery_idx + 2
         ]
+        return acceleration_samples_ts, speed_samples_ts
+
+    def fit_model_to_recovery_data(self, recovery_data):
+        acceleration_samples_ts, speed_samples_ts = recovery_data
         # These are interpolated samples to align them time-wise with the acceleration time series.
         interpolated_speed_samples_ts = speed_samples_ts.interpolate_midpoints()
         included_acceleration_samples_ts = self.get_window(acceleration_samples_ts)
         # This is a very slow-speed stroke and there aren't enough samples to fit the damping model.
         if included_acceleration_samples_ts is None:
-            # Try to return the same model as the previous stroke
-            if len(self.workout.machine.damping_models) > 0:
-                previous_model = self.workout.machine.damping_models[-1]
-                return self.FittedLinearDampingFactorModel(
-                    intercept=previous_model.intercept,
-                    slope=previous_model.slope
-                )
-            # Return a model with all-zeros parameters. This will cause us to overestimate the person-applied torque
-            # for this stroke. This is a very slow and weak stroke so this shouldn't matter too much.
-            else:
-                return self.FittedLinearDampingFactorModel(
-                    intercept=0.0,
-                    slope=0.0
-                )
+            return self._get_fallback_model()
         included_speed_samples_ts = interpolated_speed_samples_ts.get_time_slice(
             start_time=included_acceleration_samples_ts.timestamps[0],
             end_time=included_acceleration_samples_ts.timestamps[-1]
         )
         # Acceleration as a function of speed
-        y = np.array(included_acceleration_samples_ts.values)
-        X = np.array(included_speed_samples_ts.values).reshape(-1, 1)
-        fitted_linear_regression_model = LinearRegression(fit_intercept=True).fit(X, y)
-
+        accumulator = LinearLeastSquaresAccumulator()
+        accumulator.add_samples(x=included_speed_samples_ts.values, y=included_acceleration_samples_ts.values)
+        fit = accumulator.get_fit()
+        # All the speed samples are the same, so the slope is undefined.
+        if fit is None:
+            return self._get_fallback_model()
+        intercept, slope = fit
         return self.FittedLinearDampingFactorModel(
-            intercept=fitted_linear_regression_model.intercept_,
-            slope=fitted_linear_regression_model.coef_[0]
+            intercept=intercept,
+            slope=slope
         )
 
+    def _get_fallback_model(self):
+        # Try to return the same model as the previous stroke (or the warm start model)
+        if self.workout.machine.damping_model is not None:
+            previous_model = self.workout.machine.damping_model
+            return self.FittedLinearDampingFactorModel(
+                intercept=previous_model.intercept,
+                slope=previous_model.slope
+            )
+        # Return a model with all-zeros parameters. This will cause us to overestimate the person-applied torque
+        # for this stroke. This is a very slow and weak stroke so this shouldn't matter too much.
+        else:
+            return self.FittedLinearDampingFactorModel(
+                intercept=0.0,
+                slope=0.0
+            )
+
     def get_window(self, acceleration_samples_ts):
         """Here is where we select a subset of the recovery phase data points to fit our model to."""
         MIN_NUM_SAMPLES = 3
@@ -209,3 +430,97 @@ class LinearDampingFactorEstimator:
             last_sample_to_consider_idx -= 1
         # Return if the candidate passed the length test
         return result
+
+
+class RecursiveLeastSquaresDampingEstimator:
+    """Estimates the same linear damping model as LinearDampingFactorEstimator (flywheel acceleration as a linear
+    function of speed), but with exponentially-weighted recursive least squares. The model is refined in O(1) on
+    every recovery-phase acceleration sample, so it's never a stroke behind, and it's available during the first
+    stroke."""
+    UPDATES_PER_SAMPLE = True
+
+    FittedLinearDampingFactorModel = LinearDampingFactorEstimator.FittedLinearDampingFactorModel
+
+    # Older samples are down-weighted by this factor on every update. With roughly 50 recovery samples per stroke,
+    # the estimate effectively averages over the last few strokes.
+    FORGETTING_FACTOR = 0.995
+    # Initial covariance of the parameter estimates. A large value means we trust our initial guess very little.
+    INITIAL_COVARIANCE = 1e4
+    # Don't publish a model until it has seen this many samples.
+    MIN_NUM_SAMPLES = 3
+    # Covariance used when warm-starting from a cached model. It's small enough that a few noisy samples don't throw
+    # the cached model away, but large enough to adapt within a stroke or two.
+    WARM_START_COVARIANCE = 1.0
+
+    def __init__(self, workout):
+        self.workout = workout
+        self.num_samples = 0
+        self._intercept = 0.0
+        self._slope = 0.0
+        # The symmetric 2x2 covariance matrix [[p00, p01], [p01, p11]] of the (intercept, slope) estimate.
+        self._p00 = self.INITIAL_COVARIANCE
+        self._p01 = 0.0
+        self._p11 = self.INITIAL_COVARIANCE
+        self._model = None
+
+    def update(self, acceleration_idx):
+        if acceleration_idx < 1:
+            return self._model
+        acceleration_value = self.workout.machine.flywheel_acceleration.values[acceleration_idx]
+        previous_acceleration_value = self.workout.machine.flywheel_acceleration.values[acceleration_idx - 1]
+        # During the recovery the flywheel only slows down due to the damping force, and the deceleration fades as
+        # the flywheel loses speed. The samples between the end of the drive and the acceleration minimum are still
+        # affected by the person, so they're skipped too. This matches how Stroke segments the recovery phase.
+        is_recovery_sample = acceleration_value < 0 and acceleration_value >= previous_acceleration_value
+        if not is_recovery_sample:
+            return self._model
+        # Acceleration sample i sits between speed samples i and i + 1.
+        speed_value = (self.workout.machine.flywheel_speed.values[acceleration_idx + 1] +
+                       self.workout.machine.flywheel_speed.values[acceleration_idx]) / 2.0
+        self._add_sample(x=float(speed_value), y=float(acceleration_value))
+        if self.num_samples >= self.MIN_NUM_SAMPLES:
+            # Publish a new model object rather than updating the current one in place, so a reader on another
+            # thread never sees the new intercept with the old slope.
+            self._model = self.FittedLinearDampingFactorModel(intercept=self._intercept, slope=self._slope)
+        return self._model
+
+    def warm_start(self, intercept, slope):
+        self._intercept = float(intercept)
+        self._slope = float(slope)
+        self._p00 = self.WARM_START_COVARIANCE
+        self._p01 = 0.0
+        self._p11 = self.WARM_START_COVARIANCE
+        self.num_samples = self.MIN_NUM_SAMPLES
+        self._model = self.FittedLinearDampingFactorModel(intercept=self._intercept, slope=self._slope)
+        return self._model
+
+    def _add_sample(self, x, y):
+        # Standard RLS update for the regressor h = [1, x]:
+        #   k = P h / (lambda + h' P h)
+        #   theta = theta + k (y - h' theta)
+        #   P = (P - k h' P) / lambda
+        p_h0 = self._p00 + self._p01 * x
+        p_h1 = self._p01 + self._p11 * x
+        denominator = self.FORGETTING_FACTOR + p_h0 + x * p_h1
+        k0 = p_h0 / denominator
+        k1 = p_h1 / denominator
+        error = y - (self._intercept + self._slope * x)
+        self._intercept += k0 * error
+        self._slope += k1 * error
+        self._p00 = (self._p00 - k0 * p_h0) / self.FORGETTING_FACTOR
+        self._p01 = (self._p01 - k0 * p_h1) / self.FORGETTING_FACTOR
+        self._p11 = (self._p11 - k1 * p_h1) / self.FORGETTING_FACTOR
+        self.num_samples += 1
+
+    def fit_model_to_stroke_recovery_data(self, stroke):
+        """The model is refined continuously, so this just records a snapshot of it at the end of the stroke."""
+        return self.fit_model_to_recovery_data(self.get_stroke_recovery_data(stroke))
+
+    def get_stroke_recovery_data(self, stroke):
+        if self._model is None:
+            return 0.0, 0.0
+        return self._intercept, self._slope
+
+    def fit_model_to_recovery_data(self, recovery_data):
+        intercept, slope = recovery_data
+        return self.FittedLinearDampingFactorModel(intercept=intercept, slope=slope)
@@ -1,92 +1,248 @@
-from .time_series import TimeSeries
+import collections
 
+import numpy as np
 
-class Stroke:
-    def __init__(self,
-                 workout,
-                 start_idx,
-                 end_idx):
-        self.workout = workout
-        self.start_idx = start_idx
-        self.end_idx = end_idx
-        self.num_samples = end_idx - start_idx
-        self.start_time = self.workout.machine.flywheel_acceleration.timestamps[start_idx]
-        self.end_time = self.workout.machine.flywheel_acceleration.timestamps[end_idx]
-        self.duration = self.end_time - self.start_time
-
-        (self.start_of_drive_idx,
-         self.end_of_drive_idx,
-         self.start_of_recovery_idx,
-         self.end_of_recovery_idx) = self._segment_stroke()
-
-        drive_duration = self.workout.machine.flywheel_acceleration.timestamps[self.end_of_drive_idx] - \
-                         self.workout.machine.flywheel_acceleration.timestamps[self.start_of_drive_idx]
-        recovery_duration = self.workout.machine.flywheel_acceleration.timestamps[self.end_of_recovery_idx] - \
-                            self.workout.machine.flywheel_acceleration.timestamps[self.start_of_recovery_idx]
-        # Ratio is 1:2 when recovery is twice as long as drive
-        # TODO: This doesn't work well, probably due to bad stroke-to-stroke segmentation.
-        self.drive_to_recovery_ratio = recovery_duration / drive_duration
-        self.work_done_by_person = self._calculate_work_done_by_person()
-        self.average_power = self.work_done_by_person / self.duration
-
-    def _segment_stroke(self):
-        acceleration_samples = self.workout.machine.flywheel_acceleration[self.start_idx: self.end_idx].values
-        min_acceleration_value = min(acceleration_samples)
-        # Get the index (relative to workout.acceleration) of the last occurrence of the smallest acceleration value
-        # in this stroke.
-        min_acceleration_value_idx = self.start_idx \
-            + len(acceleration_samples) \
-            - acceleration_samples[::-1].index(min_acceleration_value)
-        start_of_drive_idx = self.start_idx
-        end_of_drive_idx = min_acceleration_value_idx
-        start_of_recovery_idx = min_acceleration_value_idx + 1
-        end_of_recovery_idx = self.end_idx
-        return (start_of_drive_idx, end_of_drive_idx, start_of_recovery_idx, end_of_recovery_idx)
-
-    def _calculate_work_done_by_person(self):
-        """Calculates the work done by the person who's rowing.
-                           Work_person = torque_person * angular distance
-        We calculate the total work done during this stroke via numeric integration of
-                          delta_work = instantaneous_torque * delta_theta
-        (Below we assume the flywheel speed is constant between ticks)"""
-        torque_samples_ts = self.workout.person.torque[self.start_idx: self.end_idx + 1]
-        # Speed has 1 extra sample at the beginning, and we include 1 extra sample at the end so we can interpolate
-        # to match the acceleration time series timestamps. We also include an additional look-ahead sample at the end
-        # to calculate the rotational distance traveled in the last time differential.
-        speed_samples_ts = self.workout.machine.flywheel_speed[self.start_idx: self.end_idx + 3]
-        # These are interpolated samples to align them time-wise with the torque time series.
-        interpolated_speed_samples_ts = speed_samples_ts.interpolate_midpoints()
-        # Numeric integration
-        result = 0.0
-        for idx, (torque_value, timestamp) in enumerate(torque_samples_ts):
-            instantaneous_speed = (interpolated_speed_samples_ts.values[idx] + interpolated_speed_samples_ts.values[idx + 1]) / 2.0
-            # This is why we need an extra look-ahead sample at the tail end of the speed time series.
-            next_timestamp = interpolated_speed_samples_ts.timestamps[idx + 1]
-            time_between_samples = next_timestamp - timestamp
-            delta_distance = instantaneous_speed * time_between_samples
-            result += delta_distance * torque_value
+
+# Provisional metrics of the drive of the ongoing stroke, published as soon as the drive ends. The full stroke record
+# follows at the next catch.
+DriveMetrics = collections.namedtuple(
+    'DriveMetrics',
+    ['stroke_idx', 'start_time', 'drive_time', 'peak_torque', 'work_done_by_person']
+)
+
+
+class StrokeTable:
+    """Column-oriented storage for stroke metrics: one growable numpy array per metric, with one row per stroke.
+    Aggregates over strokes are vectorized column operations, and `table[i]` / `table.values[i]` return lightweight
+    Stroke row views for code that works with one stroke at a time."""
+    __slots__ = ('_columns', '_size')
+
+    INDEX_COLUMNS = (
+        'start_idx',
+        'end_idx',
+        'start_of_drive_idx',
+        'end_of_drive_idx',
+        'start_of_recovery_idx',
+        'end_of_recovery_idx',
+    )
+    VALUE_COLUMNS = (
+        'start_time',
+        'end_time',
+        'duration',
+        'drive_to_recovery_ratio',
+        'work_done_by_person',
+        'average_power',
+        # Over the drive only, as published in last_drive. Work and power cover the whole stroke.
+        'peak_torque',
+        'flywheel_revolutions',
+        # Filled in by the boat model, on the same pulse that ends the stroke.
+        'boat_distance',
+        'average_boat_speed',
+        'split_time',
+    )
+    COLUMNS = INDEX_COLUMNS + VALUE_COLUMNS
+
+    INITIAL_CAPACITY = 64
+
+    def __init__(self):
+        self._size = 0
+        self._columns = {}
+        for name in self.INDEX_COLUMNS:
+            self._columns[name] = np.empty(self.INITIAL_CAPACITY, dtype=np.int64)
+        for name in self.VALUE_COLUMNS:
+            self._columns[name] = np.empty(self.INITIAL_CAPACITY, dtype=np.float64)
+
+    @classmethod
+    def _view(cls, columns, size):
+        """Returns a read-only table that wraps the given column arrays without copying them."""
+        result = cls.__new__(cls)
+        result._columns = columns
+        result._size = size
         return result
 
+    def append(self, **row):
+        """Adds a stroke. Value columns missing from row are set to NaN until set_values fills them in."""
+        if self._size == len(self._columns['start_idx']):
+            self._grow()
+        for name in self.INDEX_COLUMNS:
+            self._columns[name][self._size] = row[name]
+        for name in self.VALUE_COLUMNS:
+            self._columns[name][self._size] = row.get(name, np.nan)
+        self._size += 1
+
+    def set_values(self, idx, **values):
+        for name, value in values.items():
+            self._columns[name][idx] = value
+
+    def _grow(self):
+        for name, column in self._columns.items():
+            new_column = np.empty(2 * len(column), dtype=column.dtype)
+            new_column[:self._size] = column[:self._size]
+            self._columns[name] = new_column
+
+    def get_column(self, name):
+        """Returns a numpy view of one metric for all strokes."""
+        return self._columns[name][:self._size]
+
+    @property
+    def values(self):
+        """Row views of all strokes, indexable like a list."""
+        return _StrokeRows(self)
+
+    @property
+    def timestamps(self):
+        """The start time of each stroke."""
+        return self.get_column('start_time')
+
+    def get_statistics(self, num_ratio_histogram_bins=10):
+        """Returns per-workout aggregates computed over the stroke columns."""
+        if self._size == 0:
+            return {}
+        start_time = self.get_column('start_time')
+        strokes_per_minute = 60.0 / self.get_column('duration')
+        drive_to_recovery_ratio = self.get_column('drive_to_recovery_ratio')
+        ratio_histogram_counts, ratio_histogram_bin_edges = np.histogram(
+            drive_to_recovery_ratio[np.isfinite(drive_to_recovery_ratio)],
+            bins=num_ratio_histogram_bins
+        )
+        # Strokes per minute gained per minute of workout
+        strokes_per_minute_trend = 0.0
+        if self._size > 1:
+            strokes_per_minute_trend = float(np.polyfit(start_time / 60.0, strokes_per_minute, deg=1)[0])
+        return {
+            'num_strokes': self._size,
+            'total_work': float(np.sum(self.get_column('work_done_by_person'))),
+            'mean_work': float(np.mean(self.get_column('work_done_by_person'))),
+            'mean_power': float(np.mean(self.get_column('average_power'))),
+            'mean_strokes_per_minute': float(np.mean(strokes_per_minute)),
+            'strokes_per_minute_trend': strokes_per_minute_trend,
+            'ratio_histogram_counts': ratio_histogram_counts,
+            'ratio_histogram_bin_edges': ratio_histogram_bin_edges,
+        }
+
+    def __getitem__(self, idx):
+        if idx < 0:
+            idx += self._size
+        if not 0 <= idx < self._size:
+            raise IndexError('StrokeTable index out of range')
+        return Stroke(self, idx)
+
+    def __iter__(self):
+        return (Stroke(self, idx) for idx in range(self._size))
+
+    def __len__(self):
+        return self._size
+
+
+class _StrokeRows:
+    __slots__ = ('_table',)
+
+    def __init__(self, table):
+        self._table = table
+
+    def __getitem__(self, idx):
+        return self._table[idx]
+
+    def __iter__(self):
+        return iter(self._table)
+
+    def __len__(self):
+        return len(self._table)
+
+
+def _stroke_column_property(name):
+    return property(lambda self: self._table._columns[name][self._idx].item())
+
+
+class Stroke:
+    """A lightweight view of one row of a StrokeTable. Its attributes read straight from the table columns."""
+    __slots__ = ('_table', '_idx')
+
+    def __init__(self, table, idx):
+        self._table = table
+        self._idx = idx
+
+    @property
+    def num_samples(self):
+        return self.end_idx - self.start_idx
+
+    def __repr__(self):
+        return 'Stroke(%s)' % ', '.join('%s=%r' % (name, getattr(self, name)) for name in StrokeTable.COLUMNS)
+
+
+for _column_name in StrokeTable.COLUMNS:
+    setattr(Stroke, _column_name, _stroke_column_property(_column_name))
+
 
 class PersonMetricsTracker:
     # This is the filter, in seconds, that we apply when we detect the start of a new stroke.
     # It's probably safe to assume that the user will never reach 60 strokes per minute.
     MINIMUM_STROKE_DURATION_FILTER = 1.0
+    # Same idea for the end of the drive, so a brief dip in acceleration right after the catch isn't mistaken for it.
+    MINIMUM_DRIVE_DURATION_FILTER = 0.2
 
     def __init__(self, workout):
         self.workout = workout
 
-        self.torque = TimeSeries()
-        self.strokes = TimeSeries()
+        self.torque = workout.new_time_series('person_torque')
+        self.strokes = StrokeTable()
 
         self._start_of_ongoing_stroke_timestamp = float("-inf")
         self._start_of_ongoing_stroke_idx = 0
+        self._reset_segmentation(start_idx=0)
+
+        # Running totals for the ongoing stroke, updated as each torque sample is integrated.
+        self._num_integrated_torque_samples = 0
+        self._ongoing_stroke_work = 0.0
+        self._ongoing_stroke_revolutions = 0.0
+        self._ongoing_stroke_peak_torque = 0.0
+
+        self.last_drive = None
+        self._ongoing_stroke_drive_published = False
+        # The running totals are frozen into last_drive when the drive ends; DriveMetrics doesn't carry this one.
+        self._ongoing_drive_revolutions = None
+        self._num_acceleration_samples_scanned_for_drive = 0
+
+    @property
+    def work_done_in_ongoing_stroke(self):
+        """Work done by the person since the start of the ongoing stroke, lagging the latest torque sample by one
+        sample."""
+        return self._ongoing_stroke_work
+
+    @property
+    def work_done_in_ongoing_drive(self):
+        """Work done by the person so far in the drive of the ongoing stroke. It stops growing once the drive
+        ends."""
+        if self._ongoing_stroke_drive_published:
+            return self.last_drive.work_done_by_person
+        return self._ongoing_stroke_work
+
+    @property
+    def peak_torque_in_ongoing_drive(self):
+        if self._ongoing_stroke_drive_published:
+            return self.last_drive.peak_torque
+        return self._ongoing_stroke_peak_torque
+
+    @property
+    def flywheel_revolutions_in_ongoing_drive(self):
+        if self._ongoing_stroke_drive_published:
+            return self._ongoing_drive_revolutions
+        return self._ongoing_stroke_revolutions
 
     def update(self):
+        # Integrating a torque sample needs a look-ahead speed sample, so the previous torque sample is integrated
+        # now that this pulse has added it.
+        self._integrate_torque_sample()
+
         # Are we at the start of a new stroke? If so, analyze the data and update the stroke time
         # series, if not return without doing anything.
         if self._new_stroke_indicator():
-            self._process_new_stroke()
+            # The last sample currently in the acceleration time series will be the first sample of the
+            # next stroke.
+            self._process_new_stroke(start_of_next_stroke_idx=len(self.workout.machine.flywheel_acceleration) - 1)
+        self._segment_acceleration_sample()
+        if self._end_of_drive_indicator():
+            self._publish_drive(end_of_drive_idx=len(self.workout.machine.flywheel_acceleration) - 1)
 
         if len(self.workout.machine.flywheel_acceleration) < 1:
             return
@@ -105,6 +261,65 @@ class PersonMetricsTracker:
             timestamp=self.workout.machine.flywheel_acceleration.timestamps[-1]
         )
 
+    def process_batch(self, first_new_acceleration_idx, synchronous_damping_model_fits=False):
+        """Vectorized equivalent of calling update() once per acceleration sample from first_new_acceleration_idx
+        onward. The damping metrics are interleaved stroke by stroke, in the same order as the streaming path, so
+        the results are bit-identical."""
+        acceleration = self.workout.machine.flywheel_acceleration
+        num_acceleration_samples = len(acceleration)
+        for start_of_next_stroke_idx in self._find_new_strokes(first_new_acceleration_idx):
+            # The samples up to and including the first sample of the next stroke use the current damping model.
+            self.workout.machine.update_damping_metrics_batch(
+                end_idx=start_of_next_stroke_idx + 1,
+                synchronous=synchronous_damping_model_fits
+            )
+            self._update_torque_time_series_batch(end_idx=start_of_next_stroke_idx + 1)
+            self._publish_drive_batch(end_idx=start_of_next_stroke_idx)
+            self._integrate_torque_samples_batch(end_idx=start_of_next_stroke_idx)
+            self._segment_acceleration_samples_batch(end_idx=start_of_next_stroke_idx - 1)
+            self._process_new_stroke(start_of_next_stroke_idx=start_of_next_stroke_idx)
+        self.workout.machine.update_damping_metrics_batch(
+            end_idx=num_acceleration_samples,
+            synchronous=synchronous_damping_model_fits
+        )
+        self._update_torque_time_series_batch(end_idx=num_acceleration_samples)
+        self._publish_drive_batch(end_idx=num_acceleration_samples)
+        self._integrate_torque_samples_batch(end_idx=num_acceleration_samples)
+        self._segment_acceleration_samples_batch(end_idx=num_acceleration_samples - 1)
+
+    def _find_new_strokes(self, first_new_acceleration_idx):
+        """Returns the indices of the acceleration samples from first_new_acceleration_idx onward that
+        _new_stroke_indicator would flag as the start of a new stroke."""
+        first_idx = max(first_new_acceleration_idx, 1)
+        if first_idx >= len(self.workout.machine.flywheel_acceleration):
+            return []
+        acceleration_samples_ts = self.workout.machine.flywheel_acceleration[first_idx - 1:]
+        values = acceleration_samples_ts.values
+        timestamps = acceleration_samples_ts.timestamps
+        # Acceleration went from negative to positive
+        rising_edge_idxs = np.flatnonzero((values[1:] >= 0) & (values[:-1] < 0)) + 1
+        # The minimum stroke duration filter depends on the previous stroke, so apply it sequentially. There are
+        # only a handful of rising edges per stroke.
+        result = []
+        start_of_ongoing_stroke_timestamp = self._start_of_ongoing_stroke_timestamp
+        for idx in rising_edge_idxs.tolist():
+            if timestamps[idx] - start_of_ongoing_stroke_timestamp > self.MINIMUM_STROKE_DURATION_FILTER:
+                result.append(idx + first_idx - 1)
+                start_of_ongoing_stroke_timestamp = timestamps[idx]
+        return result
+
+    def _update_torque_time_series_batch(self, end_idx):
+        start_idx = len(self.torque)
+        if end_idx <= start_idx:
+            return
+        acceleration_samples_ts = self.workout.machine.flywheel_acceleration[start_idx:end_idx]
+        net_torque = acceleration_samples_ts.values * self.workout.machine.flywheel_moment_of_inertia
+        damping_torque = self.workout.machine.damping_torque[start_idx:end_idx].values
+        person_torque = net_torque - damping_torque
+        # Same as max(person_torque, 0.0), including how it treats signed zeros.
+        person_torque = np.where(0.0 > person_torque, 0.0, person_torque)
+        self.torque.extend(values=person_torque, timestamps=acceleration_samples_ts.timestamps)
+
     # This is a rough check that tells us if we have started a new stroke. This doesn't necessarily
     # flag the first few samples of the new stroke.
     def _new_stroke_indicator(self):
@@ -121,24 +336,224 @@ class PersonMetricsTracker:
         return acceleration_rising_edge and \
             (time_since_start_of_stroke_in_seconds > self.MINIMUM_STROKE_DURATION_FILTER)
 
-    def _process_new_stroke(self):
+    # The drive ends when the flywheel stops accelerating, i.e. when acceleration goes from positive to negative for
+    # the first time in the stroke.
+    def _end_of_drive_indicator(self):
+        acceleration_samples_ts = self.workout.machine.flywheel_acceleration
+        if self._ongoing_stroke_drive_published or \
+                len(acceleration_samples_ts) - 2 < self._start_of_ongoing_stroke_idx:
+            return False
+        # Acceleration went from positive to negative
+        acceleration_falling_edge = (
+            acceleration_samples_ts.values[-1] < 0 and
+            acceleration_samples_ts.values[-2] >= 0
+        )
+        time_since_start_of_stroke_in_seconds = (
+            acceleration_samples_ts.timestamps[-1] - self._start_of_ongoing_stroke_timestamp
+        )
+        return acceleration_falling_edge and \
+            (time_since_start_of_stroke_in_seconds > self.MINIMUM_DRIVE_DURATION_FILTER)
+
+    def _publish_drive(self, end_of_drive_idx):
+        # The running totals include every torque sample up to, but not including, end_of_drive_idx: the drive.
+        self.last_drive = DriveMetrics(
+            stroke_idx=len(self.strokes),
+            start_time=self._ongoing_stroke_start_time,
+            drive_time=self.workout.machine.flywheel_acceleration.timestamps[end_of_drive_idx] -
+            self._ongoing_stroke_start_time,
+            peak_torque=self._ongoing_stroke_peak_torque,
+            work_done_by_person=self._ongoing_stroke_work,
+        )
+        self._ongoing_drive_revolutions = self._ongoing_stroke_revolutions
+        self._ongoing_stroke_drive_published = True
+
+    def _publish_drive_batch(self, end_idx):
+        """Vectorized equivalent of checking _end_of_drive_indicator on every acceleration sample up to end_idx.
+        The running totals are brought up to the end of the drive first, same as in the streaming path."""
+        start_idx = max(self._start_of_ongoing_stroke_idx + 1, self._num_acceleration_samples_scanned_for_drive)
+        if self._ongoing_stroke_drive_published or end_idx <= start_idx:
+            return
+        acceleration_samples_ts = self.workout.machine.flywheel_acceleration[start_idx - 1:end_idx]
+        values = acceleration_samples_ts.values
+        timestamps = acceleration_samples_ts.timestamps[1:]
+        # Acceleration went from positive to negative
+        end_of_drive_idxs = np.flatnonzero(
+            (values[1:] < 0) & (values[:-1] >= 0) &
+            (timestamps - self._start_of_ongoing_stroke_timestamp > self.MINIMUM_DRIVE_DURATION_FILTER)
+        )
+        self._num_acceleration_samples_scanned_for_drive = end_idx
+        if len(end_of_drive_idxs) == 0:
+            return
+        end_of_drive_idx = start_idx + int(end_of_drive_idxs[0])
+        self._integrate_torque_samples_batch(end_idx=end_of_drive_idx)
+        self._segment_acceleration_samples_batch(end_idx=end_of_drive_idx)
+        self._publish_drive(end_of_drive_idx=end_of_drive_idx)
+
+    def _process_new_stroke(self, start_of_next_stroke_idx):
         # For now assume _new_stroke_indicator gives us a perfect segmentation between strokes, and
         # triggers exactly on the first sample of a new stroke.
         # TODO: more sophisticated segmentation by finding the last "credible data point" belonging to a stroke,
         #  identified by looking at the model fit residuals. For each point calculate the p value and set a cut-off
         #  threshold.
-        start_of_this_stroke_idx = self._start_of_ongoing_stroke_idx
-        end_of_this_stroke_idx = len(self.workout.machine.flywheel_acceleration) - 2
+        assert self._ongoing_stroke_min_acceleration_idx is not None, "The stroke is too short to segment!"
+        assert self._num_integrated_torque_samples == start_of_next_stroke_idx, "The stroke's torque samples " \
+                                                                                "haven't all been integrated!"
+        acceleration_timestamps = self.workout.machine.flywheel_acceleration.timestamps
+        start_idx = self._start_of_ongoing_stroke_idx
+        end_idx = start_of_next_stroke_idx - 1
+        start_time = self._ongoing_stroke_start_time
+        end_time = acceleration_timestamps[end_idx]
+        duration = end_time - start_time
+
+        # The drive ends right after the last occurrence of the smallest acceleration value in the stroke.
+        end_of_drive_idx = self._ongoing_stroke_min_acceleration_idx + 1
+        start_of_recovery_idx = end_of_drive_idx + 1
+        start_of_recovery_timestamp = self._start_of_recovery_timestamp
+        if start_of_recovery_timestamp is None:
+            # The recovery starts on the first sample of the next stroke.
+            start_of_recovery_timestamp = acceleration_timestamps[start_of_recovery_idx]
+        drive_duration = self._end_of_drive_timestamp - start_time
+        recovery_duration = end_time - start_of_recovery_timestamp
+        work_done_by_person = self._ongoing_stroke_work
 
         self.strokes.append(
-            value=Stroke(
-                workout=self.workout,
-                start_idx=start_of_this_stroke_idx,
-                end_idx=end_of_this_stroke_idx,
-            ),
-            timestamp=self.workout.machine.flywheel_acceleration.timestamps[start_of_this_stroke_idx],
+            start_idx=start_idx,
+            end_idx=end_idx,
+            start_of_drive_idx=start_idx,
+            end_of_drive_idx=end_of_drive_idx,
+            start_of_recovery_idx=start_of_recovery_idx,
+            end_of_recovery_idx=end_idx,
+            start_time=start_time,
+            end_time=end_time,
+            duration=duration,
+            # Ratio is 1:2 when recovery is twice as long as drive
+            # TODO: This doesn't work well, probably due to bad stroke-to-stroke segmentation.
+            drive_to_recovery_ratio=recovery_duration / drive_duration,
+            work_done_by_person=work_done_by_person,
+            average_power=work_done_by_person / duration,
+            # If the end of the drive was never detected, the whole stroke counts as the drive.
+            peak_torque=self.peak_torque_in_ongoing_drive,
+            flywheel_revolutions=self.flywheel_revolutions_in_ongoing_drive,
+        )
+        self._ongoing_stroke_work = 0.0
+        self._ongoing_stroke_revolutions = 0.0
+        self._ongoing_stroke_peak_torque = 0.0
+        self._ongoing_stroke_drive_published = False
+        self._ongoing_drive_revolutions = None
+        self._reset_segmentation(start_idx=start_of_next_stroke_idx)
+        self._start_of_ongoing_stroke_idx = start_of_next_stroke_idx
+        self._start_of_ongoing_stroke_timestamp = acceleration_timestamps[start_of_next_stroke_idx]
+
+    def _reset_segmentation(self, start_idx):
+        # The sample right before the start of the next stroke is never part of the search for the end of the drive.
+        self._num_segmented_acceleration_samples = start_idx
+        self._ongoing_stroke_start_time = None
+        self._ongoing_stroke_min_acceleration = float("inf")
+        self._ongoing_stroke_min_acceleration_idx = None
+        self._end_of_drive_timestamp = None
+        # This is None while the sample after the end of the drive hasn't arrived yet.
+        self._start_of_recovery_timestamp = None
+
+    def _segment_acceleration_sample(self):
+        """Feeds the next acceleration sample to the search for the end of the drive. We keep track of the last
+        occurrence of the smallest acceleration value in the ongoing stroke, plus the timestamps we need from the
+        samples right after it, so segmenting a stroke never has to look back at its samples. The latest
+        acceleration sample is only fed in on the next pulse, once we know it doesn't start a new stroke."""
+        acceleration_samples_ts = self.workout.machine.flywheel_acceleration
+        idx = self._num_segmented_acceleration_samples
+        if idx + 1 >= len(acceleration_samples_ts):
+            return
+        value = acceleration_samples_ts.values[idx]
+        next_timestamp = acceleration_samples_ts.timestamps[idx + 1]
+        if idx == self._start_of_ongoing_stroke_idx:
+            self._ongoing_stroke_start_time = acceleration_samples_ts.timestamps[idx]
+        if value <= self._ongoing_stroke_min_acceleration:
+            self._ongoing_stroke_min_acceleration = value
+            self._ongoing_stroke_min_acceleration_idx = idx
+            self._end_of_drive_timestamp = next_timestamp
+            self._start_of_recovery_timestamp = None
+        elif self._ongoing_stroke_min_acceleration_idx is not None and \
+                idx == self._ongoing_stroke_min_acceleration_idx + 1:
+            self._start_of_recovery_timestamp = next_timestamp
+        self._num_segmented_acceleration_samples = idx + 1
+
+    def _segment_acceleration_samples_batch(self, end_idx):
+        """Vectorized equivalent of calling _segment_acceleration_sample for every acceleration sample up to
+        end_idx."""
+        start_idx = self._num_segmented_acceleration_samples
+        end_idx = min(end_idx, len(self.workout.machine.flywheel_acceleration) - 1)
+        if end_idx <= start_idx:
+            return
+        acceleration_samples_ts = self.workout.machine.flywheel_acceleration[start_idx:end_idx + 1]
+        values = acceleration_samples_ts.values[:-1]
+        timestamps = acceleration_samples_ts.timestamps
+        if start_idx == self._start_of_ongoing_stroke_idx:
+            self._ongoing_stroke_start_time = timestamps[0].item()
+        if self._ongoing_stroke_min_acceleration_idx == start_idx - 1:
+            self._start_of_recovery_timestamp = timestamps[1].item()
+        # Last occurrence of the smallest value in this batch.
+        min_idx = len(values) - 1 - int(np.argmin(values[::-1]))
+        if values[min_idx] <= self._ongoing_stroke_min_acceleration:
+            self._ongoing_stroke_min_acceleration = values[min_idx].item()
+            self._ongoing_stroke_min_acceleration_idx = start_idx + min_idx
+            self._end_of_drive_timestamp = timestamps[min_idx + 1].item()
+            self._start_of_recovery_timestamp = None
+            if min_idx + 2 < len(timestamps):
+                self._start_of_recovery_timestamp = timestamps[min_idx + 2].item()
+        self._num_segmented_acceleration_samples = end_idx
+
+    def _integrate_torque_sample(self):
+        """Adds the next torque sample to the running totals of the ongoing stroke, if its look-ahead speed sample
+        is available. This is how we calculate the work done by the person who's rowing:
+                           Work_person = torque_person * angular distance
+        We calculate the total work done during a stroke via numeric integration of
+                          delta_work = instantaneous_torque * delta_theta
+        (Below we assume the flywheel speed is constant between ticks)"""
+        idx = self._num_integrated_torque_samples
+        speed_samples_ts = self.workout.machine.flywheel_speed
+        # Speed has 1 extra sample at the beginning, and we need 1 extra sample at the end so we can interpolate
+        # to match the torque time series timestamps. We also need an additional look-ahead sample at the end
+        # to calculate the rotational distance traveled in the last time differential.
+        if idx >= len(self.torque) or idx + 2 >= len(speed_samples_ts):
+            return
+        torque_value, timestamp = self.torque[idx]
+        speed_values = speed_samples_ts.values
+        speed_timestamps = speed_samples_ts.timestamps
+        # These are interpolated samples to align them time-wise with the torque time series.
+        interpolated_speed = (speed_values[idx] + speed_values[idx + 1]) / 2.0
+        next_interpolated_speed = (speed_values[idx + 1] + speed_values[idx + 2]) / 2.0
+        next_timestamp = (speed_timestamps[idx + 1] + speed_timestamps[idx + 2]) / 2.0
+        instantaneous_speed = (interpolated_speed + next_interpolated_speed) / 2.0
+        delta_distance = instantaneous_speed * (next_timestamp - timestamp)
+        self._ongoing_stroke_work += delta_distance * torque_value
+        self._ongoing_stroke_revolutions += delta_distance
+        self._ongoing_stroke_peak_torque = max(self._ongoing_stroke_peak_torque, torque_value)
+        self._num_integrated_torque_samples = idx + 1
+
+    def _integrate_torque_samples_batch(self, end_idx):
+        """Vectorized equivalent of calling _integrate_torque_sample for every torque sample up to end_idx. The
+        running totals are accumulated in sample order, so they're bit-identical to the streaming path."""
+        start_idx = self._num_integrated_torque_samples
+        end_idx = min(end_idx, len(self.torque), len(self.workout.machine.flywheel_speed) - 2)
+        if end_idx <= start_idx:
+            return
+        torque_samples_ts = self.torque[start_idx:end_idx]
+        speed_samples_ts = self.workout.machine.flywheel_speed[start_idx:end_idx + 2]
+        interpolated_speed_samples_ts = speed_samples_ts.interpolate_midpoints()
+        interpolated_speed_values = interpolated_speed_samples_ts.values
+        instantaneous_speed = (interpolated_speed_values[:-1] + interpolated_speed_values[1:]) / 2.0
+        delta_distance = instantaneous_speed * (
+            interpolated_speed_samples_ts.timestamps[1:] - torque_samples_ts.timestamps
+        )
+        # np.cumsum adds the terms one at a time, unlike np.sum.
+        self._ongoing_stroke_work = np.cumsum(
+            np.concatenate(([self._ongoing_stroke_work], delta_distance * torque_samples_ts.values))
+        )[-1].item()
+        self._ongoing_stroke_revolutions = np.cumsum(
+            np.concatenate(([self._ongoing_stroke_revolutions], delta_distance))
+        )[-1].item()
+        self._ongoing_stroke_peak_torque = max(
+            self._ongoing_stroke_peak_torque,
+            np.max(torque_samples_ts.values).item()
         )
-        # The last sample currently in the acceleration time series will be the first sample of the
-        # next stroke.
-        self._start_of_ongoing_stroke_idx = len(self.workout.machine.flywheel_acceleration) - 1
-        self._start_of_ongoing_stroke_timestamp = self.workout.machine.flywheel_acceleration.timestamps[-1]
+        self._num_integrated_torque_samples = end_idx
@@ -0,0 +1,47 @@
+import json
+
+import numpy as np
+
+
+class LatencyWindow:
+    """A rolling window of the latest latencies, e.g. pulse-to-pixel latencies: the seconds between a pulse arriving
+    from the sensor and the first GUI frame that shows it being painted. The window is a preallocated ring, so adding
+    latencies never allocates."""
+    CAPACITY = 8192
+
+    def __init__(self, capacity=CAPACITY):
+        self._latencies = np.zeros(capacity)
+        self._count = 0
+
+    def __len__(self):
+        return min(self._count, len(self._latencies))
+
+    def add(self, latencies):
+        latencies = np.asarray(latencies, dtype=np.float64)[-len(self._latencies):]
+        slots = (self._count + np.arange(len(latencies))) % len(self._latencies)
+        self._latencies[slots] = latencies
+        self._count += len(latencies)
+
+    def get_latencies(self):
+        """Returns a copy of the latencies in the window, oldest first."""
+        num_latencies = len(self)
+        start_slot = (self._count - num_latencies) % len(self._latencies)
+        return np.roll(self._latencies, -start_slot)[:num_latencies]
+
+    def get_summary(self):
+        latencies = self.get_latencies()
+        if len(latencies) == 0:
+            return {'num_samples': 0}
+        p50, p90, p99 = np.percentile(latencies, [50, 90, 99]).tolist()
+        return {
+            'num_samples': len(latencies),
+            'p50': p50,
+            'p90': p90,
+            'p99': p99,
+            'max': latencies.max().item(),
+        }
+
+    def save(self, file_path):
+        """Writes the summary and the latencies in the window, in seconds, to a JSON file."""
+        with open(file_path, 'w') as output_file:
+            json.dump(dict(self.get_summary(), latencies=self.get_latencies().tolist()), output_file)
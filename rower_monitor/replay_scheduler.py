@@ -0,0 +1,81 @@
+import threading
+import time
+
+from .pulse_latency import LatencyWindow
+
+
+class ReplayScheduler:
+    """Paces a replay so that each pulse is delivered at its recorded time divided by speed_multiplier, measured on a
+    monotonic clock from the first pulse. Waiting for the due time of every pulse, rather than sleeping between
+    pulses, keeps the time spent processing pulses from adding up over the session. With speed_multiplier=None the
+    replay runs as fast as possible.
+
+    Lateness is how long after its due time a pulse was delivered. Drift is the lateness of the latest pulse: it
+    stays near zero while the pipeline keeps up, and keeps growing once it falls behind.
+
+    cancel() wakes up a pending wait_until_due() right away, so a replay can be stopped without waiting for its next
+    pulse to be due."""
+
+    def __init__(self, speed_multiplier=1.0):
+        self.speed_multiplier = speed_multiplier
+        self._start_time = None
+        self._first_pulse_time = None
+        self._last_pulse_time = None
+        self._last_delivery_time = None
+        self._num_pulses = 0
+        self._drift = 0.0
+        self._max_lateness = 0.0
+        self._lateness_window = LatencyWindow()
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def wait_until_due(self, pulse_time):
+        """Blocks until the pulse recorded at pulse_time (in seconds) is due. Returns False, without waiting, once
+        the scheduler has been cancelled: the pulse must not be delivered then."""
+        if self._cancelled.is_set():
+            return False
+        now = time.monotonic()
+        if self._start_time is None:
+            self._start_time = now
+            self._first_pulse_time = pulse_time
+        self._last_pulse_time = pulse_time
+        self._num_pulses += 1
+        if self.speed_multiplier is None:
+            self._last_delivery_time = now
+            return True
+        due_time = self._start_time + (pulse_time - self._first_pulse_time) / self.speed_multiplier
+        if due_time > now:
+            if self._cancelled.wait(due_time - now):
+                return False
+            now = time.monotonic()
+        self._last_delivery_time = now
+        lateness = max(now - due_time, 0.0)
+        self._drift = lateness
+        self._max_lateness = max(self._max_lateness, lateness)
+        self._lateness_window.add([lateness])
+        return True
+
+    def get_statistics(self):
+        """Returns the lateness and drift of the replay so far, in seconds, and the speed multiplier it actually
+        achieved between the first and the latest pulse. The statistics don't change while the replay is paused or
+        after it has ended."""
+        if self._num_pulses == 0:
+            return {'num_pulses': 0}
+        elapsed_time = self._last_delivery_time - self._start_time
+        recorded_time = self._last_pulse_time - self._first_pulse_time
+        statistics = {
+            'num_pulses': self._num_pulses,
+            'speed_multiplier': self.speed_multiplier,
+            'achieved_speed_multiplier': recorded_time / elapsed_time if elapsed_time > 0 else float('inf'),
+        }
+        if self.speed_multiplier is not None:
+            lateness_summary = self._lateness_window.get_summary()
+            statistics.update(
+                drift=self._drift,
+                max_lateness=self._max_lateness,
+                recent_lateness_p50=lateness_summary['p50'],
+                recent_lateness_p99=lateness_summary['p99'],
+            )
+        return statistics
@@ -0,0 +1,83 @@
+import multiprocessing
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+class SharedMemoryRing:
+    """A fixed-capacity ring of rows in a multiprocessing.shared_memory block, with one writer process and any number
+    of reader processes. Rows are records of a numpy structured dtype, so counters and indices can be stored as
+    integers next to float64 values.
+
+    Every row is written twice, at slot i % capacity and at slot i % capacity + capacity, so the latest `capacity`
+    rows are always one contiguous slice of the buffer. Readers get numpy views straight into shared memory: nothing
+    is copied or pickled. Readers map the ring with read_only=True.
+
+    The writer holds the ring's lock while it writes rows and bumps the row count, and readers take the same lock to
+    read the count. The lock acts as a memory barrier, so every row up to the count a reader got is complete and
+    visible to it, even on CPUs with weakly ordered memory like ARM. The lock has to be shared with the other
+    processes, e.g. by passing it to multiprocessing.Process. A reader holding on to a view for longer than it takes
+    the writer to wrap around the whole ring will see the view's contents change underneath it."""
+    HEADER_SIZE_BYTES = 64
+
+    def __init__(self, dtype, capacity, name=None, create=False, read_only=False, lock=None):
+        self.dtype = np.dtype(dtype)
+        self.capacity = capacity
+        self.lock = multiprocessing.Lock() if lock is None else lock
+        size = self.HEADER_SIZE_BYTES + 2 * capacity * self.dtype.itemsize
+        self._shared_memory = shared_memory.SharedMemory(name=name, create=create, size=size if create else 0)
+        self._owner = create
+        self._header = np.ndarray((1,), dtype=np.int64, buffer=self._shared_memory.buf)
+        self._rows = np.ndarray(
+            (2 * capacity,),
+            dtype=self.dtype,
+            buffer=self._shared_memory.buf,
+            offset=self.HEADER_SIZE_BYTES
+        )
+        if create:
+            self._header[0] = 0
+        if read_only:
+            self._header.flags.writeable = False
+            self._rows.flags.writeable = False
+
+    @property
+    def name(self):
+        return self._shared_memory.name
+
+    @property
+    def count(self):
+        """Total number of rows written since the ring was created."""
+        with self.lock:
+            return int(self._header[0])
+
+    def new_rows(self, num_rows):
+        """Returns an uninitialized array of num_rows rows with the ring's dtype, for the writer to fill in."""
+        return np.empty(num_rows, dtype=self.dtype)
+
+    def append(self, rows):
+        """Writer side. rows is an array of the ring's dtype; only the last `capacity` rows are kept."""
+        num_new_rows = len(rows)
+        rows = rows[-self.capacity:]
+        with self.lock:
+            new_count = int(self._header[0]) + num_new_rows
+            slots = (new_count - len(rows) + np.arange(len(rows))) % self.capacity
+            self._rows[slots] = rows
+            self._rows[slots + self.capacity] = rows
+            self._header[0] = new_count
+
+    def get_latest(self, num_rows=None):
+        """Returns a view of the latest rows, oldest first. Defaults to as many rows as the ring holds. Columns are
+        accessed by name, e.g. rows['timestamp']."""
+        count = self.count
+        available_rows = min(count, self.capacity)
+        num_rows = available_rows if num_rows is None else min(num_rows, available_rows)
+        start_slot = (count - num_rows) % self.capacity
+        return self._rows[start_slot:start_slot + num_rows]
+
+    def close(self):
+        # Views into the buffer must be released before the shared memory can be closed.
+        self._header = None
+        self._rows = None
+        self._shared_memory.close()
+        if self._owner:
+            self._shared_memory.unlink()
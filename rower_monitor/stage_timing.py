@@ -0,0 +1,108 @@
+import bisect
+import json
+
+import numpy as np
+
+
+class StageTimer:
+    """Records the wall time spent in each stage of the pulse handlers into preallocated histograms with log-spaced
+    bins, so recording a pulse never allocates and the memory use doesn't grow with the session. Recording can be
+    switched on and off at any time through the enabled attribute.
+
+    Percentiles are read off the histograms, so they're upper bounds accurate to one bin (about 12%). Maxima are
+    exact. Pulses slower than outlier_threshold_seconds, and pulses that closed a stroke (that's when the per-stroke
+    work, like the damping model fit, happens), are kept as outliers along with the index of their stroke, up to
+    max_outliers of them."""
+    # 20 bins per decade, from 100 ns to 10 s.
+    BIN_EDGES_SECONDS = (10.0 ** (np.arange(-140, 21) / 20)).tolist()
+    OUTLIER_THRESHOLD_SECONDS = 0.001
+    MAX_OUTLIERS = 1000
+
+    def __init__(self, stages, outlier_threshold_seconds=OUTLIER_THRESHOLD_SECONDS, max_outliers=MAX_OUTLIERS,
+                 enabled=False):
+        self.stages = tuple(stages)
+        self.outlier_threshold_seconds = outlier_threshold_seconds
+        self.enabled = enabled
+        # One row per stage, plus one for the total. Bin i counts durations in [BIN_EDGES_SECONDS[i - 1],
+        # BIN_EDGES_SECONDS[i]), with the first and last bins catching everything below and above the edges.
+        self._counts = np.zeros((len(self.stages) + 1, len(self.BIN_EDGES_SECONDS) + 1), dtype=np.int64)
+        self._max_durations = [0.0] * (len(self.stages) + 1)
+        self._outliers = np.zeros(max_outliers, dtype=[
+            ('pulse_idx', np.int64),
+            ('stroke_idx', np.int64),
+            ('num_closed_strokes', np.int64),
+            ('total', np.float64),
+        ] + [(stage, np.float64) for stage in self.stages])
+        self._num_outliers = 0
+        self._num_samples = 0
+
+    @property
+    def num_samples(self):
+        return self._num_samples
+
+    def record(self, stage_durations, pulse_idx, stroke_idx, num_closed_strokes=0):
+        """Adds one sample. stage_durations holds the seconds spent in each stage, in the order of self.stages."""
+        total_duration = sum(stage_durations)
+        for row_idx, duration in enumerate(stage_durations + (total_duration,)):
+            self._counts[row_idx, bisect.bisect_right(self.BIN_EDGES_SECONDS, duration)] += 1
+            if duration > self._max_durations[row_idx]:
+                self._max_durations[row_idx] = duration
+        self._num_samples += 1
+        if total_duration <= self.outlier_threshold_seconds and num_closed_strokes == 0:
+            return
+        if self._num_outliers < len(self._outliers):
+            self._outliers[self._num_outliers] = (pulse_idx, stroke_idx, num_closed_strokes, total_duration) + \
+                                                 tuple(stage_durations)
+        self._num_outliers += 1
+
+    def get_percentile(self, stage, percentile):
+        """Returns an upper bound for the given percentile (0-100) of the time spent in a stage, or in all of them if
+        stage is 'total'."""
+        row_idx = len(self.stages) if stage == 'total' else self.stages.index(stage)
+        if self._num_samples == 0:
+            return float('nan')
+        cumulative_counts = np.cumsum(self._counts[row_idx])
+        bin_idx = int(np.searchsorted(cumulative_counts, percentile / 100 * self._num_samples, side='left'))
+        if bin_idx >= len(self.BIN_EDGES_SECONDS):
+            return self._max_durations[row_idx]
+        return min(self.BIN_EDGES_SECONDS[bin_idx], self._max_durations[row_idx])
+
+    def get_max(self, stage):
+        row_idx = len(self.stages) if stage == 'total' else self.stages.index(stage)
+        return self._max_durations[row_idx]
+
+    def get_outliers(self):
+        """Returns the outliers recorded so far as a structured numpy array, oldest first."""
+        return self._outliers[:min(self._num_outliers, len(self._outliers))].copy()
+
+    def get_summary(self):
+        """Returns p50/p99/max seconds per stage and the recorded outliers, as plain Python types."""
+        return {
+            'num_samples': self._num_samples,
+            'stages': {
+                stage: {
+                    'p50': self.get_percentile(stage, 50),
+                    'p99': self.get_percentile(stage, 99),
+                    'max': self.get_max(stage),
+                }
+                for stage in self.stages + ('total',)
+            },
+            'num_outliers': self._num_outliers,
+            'outliers': [
+                {name: outlier[name].item() for name in self._outliers.dtype.names}
+                for outlier in self.get_outliers()
+            ],
+        }
+
+    def reset(self):
+        self._counts[:] = 0
+        self._max_durations = [0.0] * (len(self.stages) + 1)
+        self._num_outliers = 0
+        self._num_samples = 0
+
+
+def write_summary(file_path, stage_timers):
+    """Writes the summaries of a {name: StageTimer} mapping to a JSON file. Timers without samples are left out."""
+    summary = {name: timer.get_summary() for name, timer in stage_timers.items() if timer.num_samples > 0}
+    with open(file_path, 'w') as output_file:
+        json.dump(summary, output_file, indent=2)
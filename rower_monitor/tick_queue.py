@@ -0,0 +1,105 @@
+import threading
+import time
+
+import numpy as np
+
+
+class SpscRingBuffer:
+    """A fixed-capacity FIFO of values, for exactly one producer thread and one consumer thread. With a structured
+    dtype, each value is a record, e.g. the raw ticks of a pulse along with the time it arrived.
+
+    The storage is preallocated and neither side takes a lock: the producer only ever writes _write_count, the
+    consumer only ever writes _read_count, and each side publishes its count after touching the storage. Under the
+    GIL, reading or assigning an int attribute is atomic, so the other side always sees a consistent count. When the
+    buffer is full, new values are dropped and counted as overruns instead of blocking the producer."""
+    __slots__ = ('_buffer', '_capacity', '_write_count', '_read_count', '_high_water_mark', '_num_overruns')
+
+    def __init__(self, capacity, dtype=np.int64):
+        self._buffer = np.empty(capacity, dtype=dtype)
+        self._capacity = capacity
+        # Total number of values pushed and popped since the start. Slot i % capacity holds value number i.
+        self._write_count = 0
+        self._read_count = 0
+        self._high_water_mark = 0
+        self._num_overruns = 0
+
+    @property
+    def capacity(self):
+        return self._capacity
+
+    @property
+    def depth(self):
+        """Number of values waiting to be drained."""
+        return self._write_count - self._read_count
+
+    @property
+    def high_water_mark(self):
+        """The largest depth seen since the start."""
+        return self._high_water_mark
+
+    @property
+    def num_overruns(self):
+        """Number of values dropped because the buffer was full."""
+        return self._num_overruns
+
+    def push(self, value):
+        """Producer side. Returns False if the value was dropped because the buffer is full."""
+        write_count = self._write_count
+        depth = write_count - self._read_count
+        if depth == self._capacity:
+            self._num_overruns += 1
+            return False
+        self._buffer[write_count % self._capacity] = value
+        self._write_count = write_count + 1
+        if depth + 1 > self._high_water_mark:
+            self._high_water_mark = depth + 1
+        return True
+
+    def drain(self, max_values=None):
+        """Consumer side. Returns a copy of the values waiting in the buffer, oldest first."""
+        read_count = self._read_count
+        num_values = self._write_count - read_count
+        if max_values is not None:
+            num_values = min(num_values, max_values)
+        start = read_count % self._capacity
+        end = start + num_values
+        if end <= self._capacity:
+            result = self._buffer[start:end].copy()
+        else:
+            result = np.concatenate((self._buffer[start:], self._buffer[:end - self._capacity]))
+        self._read_count = read_count + num_values
+        return result
+
+
+class TickQueueWorker(threading.Thread):
+    """Drains a SpscRingBuffer in batches and hands each batch of values to batch_callback, off the thread that fills
+    the buffer."""
+    POLL_INTERVAL_SECONDS = 0.005
+
+    def __init__(self, ring_buffer, batch_callback, poll_interval_seconds=POLL_INTERVAL_SECONDS):
+        threading.Thread.__init__(self, daemon=True)
+        self.ring_buffer = ring_buffer
+        self.batch_callback = batch_callback
+        # The producer never signals the worker, since that would mean taking a lock on every pulse, so the worker
+        # polls instead.
+        self.poll_interval_seconds = poll_interval_seconds
+        self.go = True
+        self.start()
+
+    def run(self):
+        while self.go:
+            if not self._process_batch():
+                time.sleep(self.poll_interval_seconds)
+        # Don't leave pulses behind that arrived before the producer was stopped.
+        self._process_batch()
+
+    def _process_batch(self):
+        values = self.ring_buffer.drain()
+        if len(values) == 0:
+            return False
+        self.batch_callback(values)
+        return True
+
+    def stop(self):
+        self.go = False
+        self.join()
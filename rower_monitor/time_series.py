@@ -1,72 +1,488 @@
+import bisect
+import functools
+import operator
+import time
+
+import numpy as np
+
+from .history_store import AppendOnlyChunkStore
+
+
 class TimeSeries:
-    def __init__(self, values=None, timestamps=None):
+    """A sequence of (value, timestamp) samples.
+
+    Samples are stored in contiguous numpy buffers that double in capacity when they fill up, so appending is
+    amortized O(1) and a long workout doesn't cost one boxed Python float per sample. Slicing returns a view that
+    shares its parent's buffers instead of copying them. `values` and `timestamps` are numpy views of the samples
+    currently in the series.
+
+    With track_integral=True the series also maintains the cumulative time-weighted integral of its values, which
+    turns the average over any time window into two lookups and a subtraction."""
+    __slots__ = ('_values', '_timestamps', '_integral', '_size', '_owns_buffers')
+
+    INITIAL_CAPACITY = 256
+
+    def __init__(self, values=None, timestamps=None, dtype=np.float64, track_integral=False):
         if values is None:
             values = []
         if timestamps is None:
             timestamps = []
-        self.values = values
-        self.timestamps = timestamps
+        if len(values) != len(timestamps):
+            raise ValueError('values and timestamps must have the same length.')
+        self._size = len(values)
+        capacity = max(self._size, self.INITIAL_CAPACITY)
+        self._values = np.empty(capacity, dtype=dtype)
+        self._timestamps = np.empty(capacity, dtype=np.float64)
+        self._values[:self._size] = values
+        self._timestamps[:self._size] = timestamps
+        self._integral = None
+        if track_integral:
+            # _integral[i] holds the integral of the series from its first sample up to sample i, using the same
+            # left-endpoint rule as get_average_value.
+            self._integral = np.empty(capacity, dtype=np.float64)
+            if self._size > 0:
+                self._integral[0] = 0.0
+                self._integral[1:self._size] = np.cumsum(
+                    self._values[:self._size - 1] * np.diff(self._timestamps[:self._size])
+                )
+        self._owns_buffers = True
+
+    @classmethod
+    def _view(cls, values, timestamps, integral=None):
+        """Returns a time series that wraps the given arrays without copying them."""
+        result = cls.__new__(cls)
+        result._values = values
+        result._timestamps = timestamps
+        result._integral = integral
+        result._size = len(values)
+        # Views must never write into their parent's buffers, so the first append to a view makes a private copy.
+        result._owns_buffers = False
+        return result
+
+    @property
+    def values(self):
+        return self._values[:self._size]
+
+    @property
+    def timestamps(self):
+        return self._timestamps[:self._size]
+
+    @property
+    def dtype(self):
+        return self._values.dtype
+
+    @property
+    def tracks_integral(self):
+        return self._integral is not None
 
     def append(self, value, timestamp):
-        self.values.append(value)
-        self.timestamps.append(timestamp)
+        if self._size == len(self._values) or not self._owns_buffers:
+            self._grow()
+        if self._integral is not None:
+            if self._size == 0:
+                self._integral[0] = 0.0
+            else:
+                previous_idx = self._size - 1
+                self._integral[self._size] = self._integral[previous_idx] + \
+                    self._values[previous_idx] * (timestamp - self._timestamps[previous_idx])
+        self._values[self._size] = value
+        self._timestamps[self._size] = timestamp
+        self._size += 1
+
+    def extend(self, values, timestamps):
+        """Appends a batch of samples. The result is identical to calling append() once per sample."""
+        values = np.asarray(values, dtype=self._values.dtype)
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        num_new_samples = len(values)
+        if num_new_samples == 0:
+            return
+        new_size = self._size + num_new_samples
+        if new_size > len(self._values) or not self._owns_buffers:
+            self._grow(min_capacity=new_size)
+        if self._integral is not None:
+            if self._size == 0:
+                self._integral[0] = 0.0
+                increments = values[:-1] * np.diff(timestamps)
+                first_new_integral_idx = 1
+            else:
+                previous_idx = self._size - 1
+                increments = np.empty(num_new_samples, dtype=np.float64)
+                increments[0] = self._values[previous_idx] * (timestamps[0] - self._timestamps[previous_idx])
+                increments[1:] = values[:-1] * np.diff(timestamps)
+                first_new_integral_idx = self._size
+            # np.cumsum adds sequentially, so this matches the running sum computed by append().
+            self._integral[first_new_integral_idx - 1:new_size] = np.cumsum(
+                np.concatenate(([self._integral[first_new_integral_idx - 1]], increments))
+            )
+        self._values[self._size:new_size] = values
+        self._timestamps[self._size:new_size] = timestamps
+        self._size = new_size
+
+    def _grow(self, min_capacity=0):
+        new_capacity = max(2 * self._size, min_capacity, self.INITIAL_CAPACITY)
+        new_values = np.empty(new_capacity, dtype=self._values.dtype)
+        new_timestamps = np.empty(new_capacity, dtype=np.float64)
+        new_values[:self._size] = self._values[:self._size]
+        new_timestamps[:self._size] = self._timestamps[:self._size]
+        if self._integral is not None:
+            new_integral = np.empty(new_capacity, dtype=np.float64)
+            new_integral[:self._size] = self._integral[:self._size]
+            self._integral = new_integral
+        self._values = new_values
+        self._timestamps = new_timestamps
+        self._owns_buffers = True
 
     def get_time_slice(self, start_time, end_time):
         """Returns a time series of all samples within the time interval [start_time, end_time] (inclusive)."""
-        included_mask = [start_time <= i <= end_time for i in self.timestamps]
-        try:
-            first_included_item_idx = included_mask.index(True)
-        except ValueError:
-            # Included mask is all-false, return empty time series.
-            return TimeSeries()
-        else:
-            last_included_item_idx = len(included_mask) - included_mask[::-1].index(True)
-            return self[first_included_item_idx: last_included_item_idx]
+        # Timestamps are monotonically increasing, so we can find the slice boundaries with a binary search.
+        first_included_item_idx, last_included_item_idx = self._get_time_slice_bounds(start_time, end_time)
+        if first_included_item_idx >= last_included_item_idx:
+            # No samples in this time interval, return empty time series.
+            return TimeSeries(dtype=self.dtype)
+        return self[first_included_item_idx: last_included_item_idx]
+
+    def _get_time_slice_bounds(self, start_time, end_time):
+        """Returns the [first, last) index range of the samples within [start_time, end_time]."""
+        timestamps = self.timestamps
+        first_included_item_idx = int(np.searchsorted(timestamps, start_time, side='left'))
+        last_included_item_idx = int(np.searchsorted(timestamps, end_time, side='right'))
+        return first_included_item_idx, last_included_item_idx
+
+    def search_values(self, value, side='left'):
+        """For series whose values never decrease, like distances, returns the index where value would be inserted
+        to keep them sorted, same as np.searchsorted."""
+        return int(np.searchsorted(self._values[:self._size], value, side=side))
 
     def get_average_value(self, start_time=None, end_time=None):
+        """Returns the time-weighted average of the samples within [start_time, end_time] (inclusive). Each sample
+        is weighted by the time until the next sample in the window."""
         if start_time is None and end_time is None:
-            data = self
+            first_idx, last_idx = 0, self._size
         else:
-            data = self.get_time_slice(start_time, end_time)
-        total_time = data.timestamps[-1] - data.timestamps[0]
-        accum = 0.0
-        for idx, (value, timestamp) in enumerate(data):
-            if idx == len(data) - 1:
-                duration = 0
-            else:
-                next_timestamp = data.timestamps[idx+1]
-                duration = next_timestamp - timestamp  # TODO: is this the right way to calculate this?
-            accum += value * duration
+            first_idx, last_idx = self._get_time_slice_bounds(start_time, end_time)
+        if first_idx >= last_idx:
+            raise IndexError('There are no samples in the requested time window.')
+        timestamps = self._timestamps
+        total_time = float(timestamps[last_idx - 1] - timestamps[first_idx])
+        if self._integral is not None:
+            # The integral index makes this O(1) no matter how many samples the window holds.
+            accum = float(self._integral[last_idx - 1] - self._integral[first_idx])
+        else:
+            durations = np.diff(timestamps[first_idx:last_idx])  # TODO: is this the right way to calculate this?
+            accum = float(np.dot(self._values[first_idx:last_idx - 1], durations))
         return accum / total_time
 
+    def get_trailing_average_value(self, window_duration):
+        """Returns the time-weighted average over the last window_duration seconds of the series."""
+        end_time = self._timestamps[self._size - 1]
+        return self.get_average_value(start_time=end_time - window_duration, end_time=end_time)
+
     def interpolate_midpoints(self):
         """Returns interpolated samples at the midpoints of the existing data points. We use this to align the
         timestamps of acceleration and speed time series."""
         # TODO: Fancy polynomial interpolation
-        result = TimeSeries()
-        for idx, (value, timestamp) in enumerate(self):
-            if idx == len(self) - 1:
-                break
-            next_value_in_ts, next_timestamp_in_ts = self[idx + 1]
-            result.append(
-                value=(value + next_value_in_ts) / 2.0,
-                timestamp=(timestamp + next_timestamp_in_ts) / 2.0
-            )
-        return result
+        if self._size < 2:
+            return TimeSeries()
+        values = self.values
+        timestamps = self.timestamps
+        return TimeSeries._view(
+            values=(values[:-1] + values[1:]) / 2.0,
+            timestamps=(timestamps[:-1] + timestamps[1:]) / 2.0
+        )
 
     def __getitem__(self, idx):
-        if type(idx) is int:
-            return self.values[idx], self.timestamps[idx]
-        elif type(idx) is slice:
-            return TimeSeries(values=self.values[idx], timestamps=self.timestamps[idx])
+        if type(idx) is slice:
+            # The integral index is only meaningful for contiguous slices. Differences between its entries are still
+            # valid after slicing, which is all get_average_value needs.
+            integral = None
+            if self._integral is not None and idx.step in (None, 1):
+                integral = self._integral[:self._size][idx]
+            return TimeSeries._view(
+                values=self._values[:self._size][idx],
+                timestamps=self._timestamps[:self._size][idx],
+                integral=integral
+            )
+        try:
+            idx = operator.index(idx)
+        except TypeError:
+            raise IndexError() from None
+        if idx < 0:
+            idx += self._size
+        if not 0 <= idx < self._size:
+            raise IndexError('TimeSeries index out of range')
+        return self._values[idx], self._timestamps[idx]
+
+    def __iter__(self):
+        return zip(self.values.tolist(), self.timestamps.tolist())
+
+    def __len__(self):
+        return self._size
+
+    def __str__(self):
+        return 'TimeSeries(values=%s, timestamps=%s)' % (self.values, self.timestamps)
+
+    def __repr__(self):
+        return 'TimeSeries(values=%r, timestamps=%r)' % (self.values, self.timestamps)
+
+
+def _retry_if_spilled(read_method):
+    """Reruns a read of a SpillingTimeSeries if the series spilled while the read ran, e.g. when the GUI thread
+    reads a series the data thread is appending to. A spill changes how absolute indices map onto the hot buffers,
+    so a read that overlapped one may have mixed up the two mappings."""
+    @functools.wraps(read_method)
+    def wrapper(self, *args, **kwargs):
+        while True:
+            spill_generation = self._spill_generation
+            # The generation is odd while a spill is in progress.
+            if spill_generation % 2 == 1:
+                time.sleep(0)
+                continue
+            try:
+                result = read_method(self, *args, **kwargs)
+            except IndexError:
+                if self._spill_generation == spill_generation:
+                    raise
+                continue
+            if self._spill_generation == spill_generation:
+                return result
+    return wrapper
+
+
+class SpillingTimeSeries(TimeSeries):
+    """A time series that keeps only a hot window of recent samples in RAM, and flushes older samples in chunks to
+    an on-disk append-only store. Indices are absolute (sample 0 is always the first sample ever appended), so
+    historic samples and time ranges can be queried through the regular TimeSeries interface; they're just slower
+    to read.
+
+    Samples at or after the index passed to retain_from() are never spilled, so callers can pin the lookback their
+    logic needs (e.g. the last complete stroke) on top of the minimum hot window size.
+
+    Other threads can read the series while one thread appends to it. Spills copy the hot samples into new buffers
+    instead of shifting them in place, and reads that overlap a spill are retried, so readers never see torn
+    data. Slices are copies."""
+    __slots__ = ('_store', '_num_spilled', '_hot_window_samples', '_retain_from_idx', '_spill_generation')
+
+    SPILL_CHUNK_SAMPLES = 1024
+
+    TIMESTAMP_COLUMN = 0
+    VALUE_COLUMN = 1
+    INTEGRAL_COLUMN = 2
+
+    def __init__(self, store_file_path, hot_window_samples, track_integral=False):
+        super(SpillingTimeSeries, self).__init__(track_integral=track_integral)
+        self._store = AppendOnlyChunkStore(file_path=store_file_path, num_columns=3 if track_integral else 2)
+        self._num_spilled = 0
+        # Keep at least one sample in RAM so appends can always extend the integral index.
+        self._hot_window_samples = max(hot_window_samples, 1)
+        self._retain_from_idx = None
+        self._spill_generation = 0
+
+    @property
+    def num_spilled_samples(self):
+        return self._num_spilled
+
+    @property
+    def values(self):
+        return _SpilledColumn(self, self.VALUE_COLUMN)
+
+    @property
+    def timestamps(self):
+        return _SpilledColumn(self, self.TIMESTAMP_COLUMN)
+
+    def retain_from(self, idx):
+        """Pins all samples from absolute index idx onward in RAM."""
+        self._retain_from_idx = idx
+
+    def close(self):
+        """Closes the spill file and its memory map. Spilled samples can't be read afterwards."""
+        self._store.close()
+
+    def append(self, value, timestamp):
+        super(SpillingTimeSeries, self).append(value, timestamp)
+        if self._size >= self._hot_window_samples + self.SPILL_CHUNK_SAMPLES:
+            self._spill()
+
+    def extend(self, values, timestamps):
+        super(SpillingTimeSeries, self).extend(values, timestamps)
+        if self._size >= self._hot_window_samples + self.SPILL_CHUNK_SAMPLES:
+            self._spill()
+
+    def _spill(self):
+        num_samples_to_spill = self._size - self._hot_window_samples
+        if self._retain_from_idx is not None:
+            num_samples_to_spill = min(num_samples_to_spill, self._retain_from_idx - self._num_spilled)
+        # Only flush whole chunks, so the store sees a few large writes instead of many small ones.
+        if num_samples_to_spill < self.SPILL_CHUNK_SAMPLES:
+            return
+        columns = [self._timestamps[:num_samples_to_spill], self._values[:num_samples_to_spill]]
+        if self._integral is not None:
+            columns.append(self._integral[:num_samples_to_spill])
+        self._store.append(np.column_stack(columns))
+        # Move the remaining hot samples to the front of new buffers. Readers on other threads may still be reading
+        # the old ones, so they're left untouched.
+        num_hot_samples = self._size - num_samples_to_spill
+        new_values = np.empty_like(self._values)
+        new_values[:num_hot_samples] = self._values[num_samples_to_spill:self._size]
+        new_timestamps = np.empty_like(self._timestamps)
+        new_timestamps[:num_hot_samples] = self._timestamps[num_samples_to_spill:self._size]
+        new_integral = None
+        if self._integral is not None:
+            new_integral = np.empty_like(self._integral)
+            new_integral[:num_hot_samples] = self._integral[num_samples_to_spill:self._size]
+        self._spill_generation += 1
+        self._values = new_values
+        self._timestamps = new_timestamps
+        self._integral = new_integral
+        self._size = num_hot_samples
+        self._num_spilled += num_samples_to_spill
+        self._spill_generation += 1
+
+    @_retry_if_spilled
+    def _read_column(self, column, start, stop):
+        """Returns a copy of the samples in the absolute index range [start, stop) of the given column."""
+        hot_buffer = (self._timestamps, self._values, self._integral)[column]
+        parts = []
+        if start < self._num_spilled:
+            parts.append(self._store.get_records()[start:min(stop, self._num_spilled), column])
+        if stop > self._num_spilled:
+            parts.append(hot_buffer[max(start - self._num_spilled, 0):stop - self._num_spilled])
+        if len(parts) == 1:
+            return np.array(parts[0])
+        return np.concatenate(parts)
+
+    @_retry_if_spilled
+    def _read_item(self, column, idx):
+        if idx >= self._num_spilled:
+            return (self._timestamps, self._values, self._integral)[column][idx - self._num_spilled]
+        return self._store.get_records()[idx, column]
+
+    def _normalize_index(self, idx):
+        try:
+            idx = operator.index(idx)
+        except TypeError:
+            raise IndexError() from None
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError('TimeSeries index out of range')
+        return idx
+
+    @_retry_if_spilled
+    def _searchsorted(self, target, side, column=TIMESTAMP_COLUMN):
+        hot_column = (self._timestamps, self._values)[column][:self._size]
+        # Recent samples are by far the most common queries, so try the hot window first.
+        if self._num_spilled == 0 or (self._size > 0 and (
+                target > hot_column[0] or (side == 'right' and target >= hot_column[0]))):
+            return self._num_spilled + int(np.searchsorted(hot_column, target, side=side))
+        # np.searchsorted would copy the whole strided column out of the memory map first, while bisecting only
+        # reads the handful of records it probes.
+        bisect_function = bisect.bisect_left if side == 'left' else bisect.bisect_right
+        idx = bisect_function(self._store.get_records()[:, column], target)
+        if idx < self._num_spilled:
+            return idx
+        return self._num_spilled + int(np.searchsorted(hot_column, target, side=side))
+
+    def _get_time_slice_bounds(self, start_time, end_time):
+        return self._searchsorted(start_time, side='left'), self._searchsorted(end_time, side='right')
+
+    def search_values(self, value, side='left'):
+        return self._searchsorted(value, side=side, column=self.VALUE_COLUMN)
+
+    def get_average_value(self, start_time=None, end_time=None):
+        if start_time is None and end_time is None:
+            first_idx, last_idx = 0, len(self)
         else:
-            raise IndexError()
+            first_idx, last_idx = self._get_time_slice_bounds(start_time, end_time)
+        if first_idx >= last_idx:
+            raise IndexError('There are no samples in the requested time window.')
+        total_time = float(
+            self._read_item(self.TIMESTAMP_COLUMN, last_idx - 1) - self._read_item(self.TIMESTAMP_COLUMN, first_idx)
+        )
+        if self._integral is not None:
+            accum = float(
+                self._read_item(self.INTEGRAL_COLUMN, last_idx - 1) - self._read_item(self.INTEGRAL_COLUMN, first_idx)
+            )
+        else:
+            durations = np.diff(self._read_column(self.TIMESTAMP_COLUMN, first_idx, last_idx))
+            accum = float(np.dot(self._read_column(self.VALUE_COLUMN, first_idx, last_idx - 1), durations))
+        return accum / total_time
+
+    def get_trailing_average_value(self, window_duration):
+        end_time = self._read_item(self.TIMESTAMP_COLUMN, len(self) - 1)
+        return self.get_average_value(start_time=end_time - window_duration, end_time=end_time)
+
+    def interpolate_midpoints(self):
+        return self[:].interpolate_midpoints()
+
+    def __getitem__(self, idx):
+        if type(idx) is slice:
+            start, stop, step = idx.indices(len(self))
+            # Slices can span the store and the hot window, and the hot buffers get shifted on every spill, so
+            # slices of a spilling time series are copies rather than views.
+            indices = range(start, stop, step)
+            if len(indices) == 0:
+                return TimeSeries(dtype=self.dtype)
+            lo = min(indices[0], indices[-1])
+            hi = max(indices[0], indices[-1]) + 1
+            integral = None
+            if self._integral is not None and step == 1:
+                integral = self._read_column(self.INTEGRAL_COLUMN, lo, hi)
+            return TimeSeries._view(
+                values=self._read_column(self.VALUE_COLUMN, lo, hi)[::step],
+                timestamps=self._read_column(self.TIMESTAMP_COLUMN, lo, hi)[::step],
+                integral=integral
+            )
+        idx = self._normalize_index(idx)
+        return self._read_item(self.VALUE_COLUMN, idx), self._read_item(self.TIMESTAMP_COLUMN, idx)
+
+    def __iter__(self):
+        return zip(iter(self.values), iter(self.timestamps))
 
     def __len__(self):
-        return len(self.values)
+        while True:
+            spill_generation = self._spill_generation
+            length = self._num_spilled + self._size
+            if spill_generation % 2 == 0 and self._spill_generation == spill_generation:
+                return length
 
     def __str__(self):
-        return str(self.__dict__)
+        return 'SpillingTimeSeries(num_samples=%d, num_spilled_samples=%d)' % (len(self), self._num_spilled)
 
     def __repr__(self):
-        return repr(self.__dict__)
+        return str(self)
+
+
+class _SpilledColumn:
+    """Read-only, sequence-like access to one column (values or timestamps) of a SpillingTimeSeries, using the same
+    absolute indices as the series itself. Converting it to a numpy array loads the whole column."""
+    __slots__ = ('_series', '_column')
+
+    ITER_CHUNK_SAMPLES = 8192
+
+    def __init__(self, series, column):
+        self._series = series
+        self._column = column
+
+    def __getitem__(self, idx):
+        if type(idx) is slice:
+            return np.asarray(self._series[idx].values if self._column == SpillingTimeSeries.VALUE_COLUMN
+                              else self._series[idx].timestamps)
+        return self._series._read_item(self._column, self._series._normalize_index(idx))
+
+    def __len__(self):
+        return len(self._series)
+
+    def __iter__(self):
+        num_samples = len(self._series)
+        for chunk_start in range(0, num_samples, self.ITER_CHUNK_SAMPLES):
+            chunk_stop = min(chunk_start + self.ITER_CHUNK_SAMPLES, num_samples)
+            yield from self._series._read_column(self._column, chunk_start, chunk_stop).tolist()
+
+    def __array__(self, dtype=None, copy=None):
+        result = self._series._read_column(self._column, 0, len(self._series))
+        if dtype is not None:
+            result = result.astype(dtype, copy=False)
+        return result
+
+    def tolist(self):
+        return list(self)
@@ -1,14 +1,25 @@
 import csv
 import datetime
 import os
+import tempfile
+import time
+
+import numpy as np
 
 from . import boat_metrics
+from . import damping_model_cache
 from . import data_sources as ds
 from . import machine_metrics
 from . import person_metrics
+from . import stage_timing
+from .time_series import SpillingTimeSeries, TimeSeries
 
 
 class WorkoutMetricsTracker:
+    TIMED_STAGES = ('machine', 'person', 'boat', 'retention', 'emit')
+    # A batch holds many pulses, so it only counts as an outlier when it takes much longer than a single pulse.
+    BATCH_OUTLIER_THRESHOLD_SECONDS = 0.02
+
     def __init__(
             self,
             config,
@@ -19,39 +30,268 @@ class WorkoutMetricsTracker:
     ):
         self.data_source = data_source
 
+        # Bounded-memory retention mode: only the most recent samples stay in RAM, and older ones are spilled to
+        # disk until the workout is closed.
+        self.hot_window_samples = config.hot_window_samples
+        self._spill_folder = None
+        self._spilling_time_series = []
+        # The raw ticks for the log, kept in RAM once the spilled history is released.
+        self._released_raw_ticks = None
+        if self.hot_window_samples is not None:
+            if config.spill_folder_path is not None:
+                os.makedirs(config.spill_folder_path, exist_ok=True)
+            self._spill_folder = tempfile.TemporaryDirectory(prefix='rower_monitor_', dir=config.spill_folder_path)
+        self._strokes_seen_by_retention = 0
+
         self.machine = machine_metrics_tracker_class(
             workout=self,
             flywheel_moment_of_inertia=config.flywheel_moment_of_inertia,
             damping_model_estimator_class=config.damping_model_estimator_class,
             num_encoder_pulses_per_revolution=config.num_flywheel_encoder_pulses_per_revolution,
+            fit_damping_model_in_background=config.fit_damping_model_in_background,
         )
         self.person = person_metrics_tracker_class(self)
         self.boat = boat_model_class(self)
+        # Strokes are added to person.strokes before the boat model fills in their boat metrics, so the GUI thread
+        # only reads strokes below this count, which is updated once the boat model is done.
+        self.num_completed_strokes = 0
+        # When each pulse arrived from the sensor, on the time.perf_counter() clock, so the GUI can measure how long
+        # it takes for a pulse to show up on screen. perf_counter is system-wide on Linux and Windows, so these can be
+        # compared across processes. Only kept while measuring.
+        self.measure_pulse_latency = config.measure_pulse_latency
+        self.pulse_arrival_times = None
+        if self.measure_pulse_latency:
+            self.pulse_arrival_times = self.new_time_series('pulse_arrival_time')
+
+        # Start from the damping model fitted in a previous session on the same machine and damper setting, if any.
+        self._damping_model_cache = None
+        self._damping_model_cache_key = damping_model_cache.DampingModelCache.make_key(
+            machine_name=config.machine_name,
+            damper_setting=config.damper_setting
+        )
+        if config.damping_model_cache_path is not None:
+            self._damping_model_cache = damping_model_cache.DampingModelCache(config.damping_model_cache_path)
+            cached_damping_model = self._damping_model_cache.get(self._damping_model_cache_key)
+            if cached_damping_model is not None:
+                intercept, slope = cached_damping_model
+                self.machine.warm_start_damping_model(intercept=intercept, slope=slope)
 
         self._ui_callback = None
         self._qt_signal_emitter = None
 
+        # Per-stage timing of the pulse handlers. Switch it on and off at any time with set_stage_timing_enabled().
+        self.pulse_stage_timer = stage_timing.StageTimer(stages=self.TIMED_STAGES)
+        self.batch_stage_timer = stage_timing.StageTimer(
+            stages=self.TIMED_STAGES,
+            outlier_threshold_seconds=self.BATCH_OUTLIER_THRESHOLD_SECONDS
+        )
+        self.set_stage_timing_enabled(config.enable_stage_timing)
+
     def start(self, ui_callback=None, qt_signal_emitter=None):
         self._ui_callback = ui_callback
         self._qt_signal_emitter = qt_signal_emitter
-        self.data_source.start(self.flywheel_sensor_pulse_handler)
+        self.data_source.start(
+            sensor_pulse_event_handler_callback=self.flywheel_sensor_pulse_handler,
+            sensor_pulse_batch_event_handler_callback=self.flywheel_sensor_pulse_batch_handler
+        )
 
     def stop(self):
+        """Stops the data source and waits for it, so no more pulses arrive. The workout can be started again."""
         self.data_source.stop()
+        self.machine.finish_pending_damping_model_fits()
+        self._save_damping_model_to_cache()
+
+    def close(self):
+        """Releases the spill files once the workout won't be started again. Call stop() first, so nothing is still
+        appending to them. save() keeps working afterwards."""
+        self._release_spilled_history()
 
-    def flywheel_sensor_pulse_handler(self, sensor_pulse_time, raw_tick_value):
+    def _release_spilled_history(self):
+        """Closes the spill files and deletes the spill folder. Only the raw ticks are kept, so save() still works.
+        The memory maps must be closed first, since Windows doesn't delete files that are still mapped."""
+        if self._spill_folder is None:
+            return
+        self._released_raw_ticks = np.array(self.machine.raw_ticks, dtype=np.int64)
+        for time_series in self._spilling_time_series:
+            time_series.close()
+        self._spilling_time_series = []
+        self._spill_folder.cleanup()
+        self._spill_folder = None
+
+    def _save_damping_model_to_cache(self):
+        # Only cache models that were actually fitted to this session's data.
+        if self._damping_model_cache is None or len(self.machine.damping_models) == 0:
+            return
+        self._damping_model_cache.put(
+            key=self._damping_model_cache_key,
+            intercept=self.machine.damping_model.intercept,
+            slope=self.machine.damping_model.slope
+        )
+        self._damping_model_cache.save()
+
+    def set_stage_timing_enabled(self, enabled):
+        self.pulse_stage_timer.enabled = enabled
+        self.batch_stage_timer.enabled = enabled
+
+    def get_stage_timing_summary(self):
+        """Returns p50/p99/max seconds per pulse handler stage, plus the outlier pulses, for both the per-pulse and
+        the batch handlers."""
+        return {
+            'pulse': self.pulse_stage_timer.get_summary(),
+            'batch': self.batch_stage_timer.get_summary(),
+        }
+
+    def flywheel_sensor_pulse_handler(self, sensor_pulse_time, raw_tick_value, arrival_time=None):
+        """arrival_time is when the data source got the pulse, on the time.perf_counter() clock. If it's not given, the
+        pulse is taken to arrive now."""
+        if self.measure_pulse_latency:
+            self.pulse_arrival_times.append(
+                value=time.perf_counter() if arrival_time is None else arrival_time,
+                timestamp=sensor_pulse_time
+            )
+        if self.pulse_stage_timer.enabled:
+            self._timed_flywheel_sensor_pulse_handler(sensor_pulse_time, raw_tick_value)
+            return
         self.machine.update(
             sensor_pulse_time=sensor_pulse_time,
             raw_tick_value=raw_tick_value
         )
         self.person.update()
         self.boat.update()
+        self.num_completed_strokes = len(self.person.strokes)
+        self._update_history_retention()
+        self._notify_ui()
 
+    def _timed_flywheel_sensor_pulse_handler(self, sensor_pulse_time, raw_tick_value):
+        num_strokes = len(self.person.strokes)
+        start_time = time.perf_counter()
+        self.machine.update(
+            sensor_pulse_time=sensor_pulse_time,
+            raw_tick_value=raw_tick_value
+        )
+        machine_end_time = time.perf_counter()
+        self.person.update()
+        person_end_time = time.perf_counter()
+        self.boat.update()
+        self.num_completed_strokes = len(self.person.strokes)
+        boat_end_time = time.perf_counter()
+        self._update_history_retention()
+        retention_end_time = time.perf_counter()
+        self._notify_ui()
+        emit_end_time = time.perf_counter()
+        self.pulse_stage_timer.record(
+            stage_durations=(
+                machine_end_time - start_time,
+                person_end_time - machine_end_time,
+                boat_end_time - person_end_time,
+                retention_end_time - boat_end_time,
+                emit_end_time - retention_end_time,
+            ),
+            pulse_idx=len(self.machine.encoder_pulses) - 1,
+            stroke_idx=num_strokes,
+            num_closed_strokes=len(self.person.strokes) - num_strokes
+        )
+
+    def _notify_ui(self):
         if self._qt_signal_emitter is not None:
             self._qt_signal_emitter.updated.emit()
         elif self._ui_callback is not None:
             self._ui_callback(self)
 
+    def process_batch(self, raw_ticks):
+        """Processes a batch of raw tick values with vectorized operations, e.g. to replay a recorded workout. The
+        results are bit-identical to feeding the same ticks to flywheel_sensor_pulse_handler one at a time. Damping
+        model fits run synchronously here even if fit_damping_model_in_background is set, so the results don't
+        depend on thread scheduling."""
+        self._process_pulse_batch(
+            sensor_pulse_times=self.data_source.get_timestamps_from_raw_ticks(raw_ticks),
+            raw_tick_values=raw_ticks,
+            arrival_times=None,
+            synchronous_damping_model_fits=True
+        )
+
+    def flywheel_sensor_pulse_batch_handler(self, sensor_pulse_times, raw_tick_values, arrival_times=None):
+        """arrival_times are when the data source got each pulse, on the time.perf_counter() clock. If they're not
+        given, the pulses are taken to arrive now."""
+        self._process_pulse_batch(
+            sensor_pulse_times=sensor_pulse_times,
+            raw_tick_values=raw_tick_values,
+            arrival_times=arrival_times,
+            synchronous_damping_model_fits=False
+        )
+
+    def _process_pulse_batch(self, sensor_pulse_times, raw_tick_values, arrival_times,
+                             synchronous_damping_model_fits):
+        if self.measure_pulse_latency:
+            if arrival_times is None:
+                arrival_times = np.full(len(sensor_pulse_times), time.perf_counter())
+            self.pulse_arrival_times.extend(values=arrival_times, timestamps=sensor_pulse_times)
+        timed = self.batch_stage_timer.enabled
+        if timed:
+            num_strokes = len(self.person.strokes)
+            start_time = time.perf_counter()
+        first_new_pulse_idx = len(self.machine.encoder_pulses)
+        first_new_acceleration_idx = len(self.machine.flywheel_acceleration)
+        self.machine.update_flywheel_metrics_batch(
+            sensor_pulse_times=sensor_pulse_times,
+            raw_tick_values=raw_tick_values
+        )
+        if timed:
+            machine_end_time = time.perf_counter()
+        self.person.process_batch(
+            first_new_acceleration_idx=first_new_acceleration_idx,
+            synchronous_damping_model_fits=synchronous_damping_model_fits
+        )
+        if timed:
+            person_end_time = time.perf_counter()
+        self.boat.process_batch(first_new_pulse_idx=first_new_pulse_idx)
+        self.num_completed_strokes = len(self.person.strokes)
+        if timed:
+            boat_end_time = time.perf_counter()
+        self._update_history_retention()
+        if timed:
+            retention_end_time = time.perf_counter()
+        self._notify_ui()
+        if timed:
+            emit_end_time = time.perf_counter()
+            self.batch_stage_timer.record(
+                stage_durations=(
+                    machine_end_time - start_time,
+                    person_end_time - machine_end_time,
+                    boat_end_time - person_end_time,
+                    retention_end_time - boat_end_time,
+                    emit_end_time - retention_end_time,
+                ),
+                pulse_idx=first_new_pulse_idx,
+                stroke_idx=num_strokes,
+                num_closed_strokes=len(self.person.strokes) - num_strokes
+            )
+
+    def new_time_series(self, name, track_integral=False):
+        """Creates the time series for one of the workout metrics, honoring the configured retention mode."""
+        if self._spill_folder is None:
+            return TimeSeries(track_integral=track_integral)
+        time_series = SpillingTimeSeries(
+            store_file_path=os.path.join(self._spill_folder.name, name + '.bin'),
+            hot_window_samples=self.hot_window_samples,
+            track_integral=track_integral,
+        )
+        self._spilling_time_series.append(time_series)
+        return time_series
+
+    def _update_history_retention(self):
+        # Stroke segmentation and work integration only keep running totals, so the only lookback left is the damping
+        # model fit, which reads the speed and acceleration samples in the recovery phase of the last complete stroke.
+        if self._spill_folder is None or len(self.person.strokes) == self._strokes_seen_by_retention:
+            return
+        self._strokes_seen_by_retention = len(self.person.strokes)
+        start_of_last_recovery_idx = self.person.strokes.values[-1].start_of_recovery_idx
+        for time_series in (
+                self.machine.flywheel_speed,
+                self.machine.flywheel_acceleration,
+        ):
+            time_series.retain_from(start_of_last_recovery_idx)
+
     # TODO: change this to take in output_file_path -- decide file names within app.py
     def save(self, output_folder_path, output_file_name=None):
         if output_file_name is None:
@@ -63,5 +303,11 @@ class WorkoutMetricsTracker:
             csv_writer.writerow(
                 [ds.CsvFile.RAW_TICKS_COLUMN_NAME]
             )
-            csv_writer.writerows([[x] for x in self.machine.raw_ticks])
+            raw_ticks = self.machine.raw_ticks if self._released_raw_ticks is None else self._released_raw_ticks
+            csv_writer.writerows([[int(x)] for x in raw_ticks])
+        if self.pulse_stage_timer.num_samples > 0 or self.batch_stage_timer.num_samples > 0:
+            stage_timing.write_summary(
+                file_path=os.path.splitext(output_file_path)[0] + '_stage_timing.json',
+                stage_timers={'pulse': self.pulse_stage_timer, 'batch': self.batch_stage_timer}
+            )
         return